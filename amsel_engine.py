@@ -1,4 +1,16 @@
+import bitboard
+from eval_cache import EvalCache
+from pawn_hash import PawnHashTable
+import piece_square
 import util
+import zobrist
+
+
+def get_pawn_mask(game):
+    """Return the mask of the pawns of both colors.
+    The pawn structure terms only look at pawns, so their sum can be cached by the pawn hash of the game."""
+    board = game.board
+    return board.get_piece_mask('pawn', 'white') | board.get_piece_mask('pawn', 'black')
 
 
 def get_backward_pawns(game, color):
@@ -8,30 +20,19 @@ def get_backward_pawns(game, color):
         on its current file or on either adjacent file, and cannot advance safely.
         """
     backward_pawns = set()
-    pawns = game.board.get_pieces_by_type_and_color('pawn', color)
-    for pawn in pawns:
-        file = pawn.square[0]
-        coords = pawn.position
-        pawn_color = pawn.color
-        is_isolated = file == 'a' or file == 'h' or not \
-            game.board.get_piece_by_coordinates(coords[0], coords[1] - 1) or not \
-            game.board.get_piece_by_coordinates(coords[0] - 1, coords[1] - 1) or not \
-            game.board.get_piece_by_coordinates(coords[0] + 1, coords[1] - 1)
-        if is_isolated:
+    board = game.board
+    pawns = get_pawn_mask(game)
+    own_pawns = board.get_piece_mask('pawn', color)
+    for index in bitboard.iterate_bits(own_pawns):
+        file = index % 8
+        # Pawns on the edge files and pawns without a pawn on each of the three squares towards rank 8 are skipped
+        if file == 0 or file == 7 or pawns & 0b111 << index - 9 != 0b111 << index - 9:
             continue
-        if pawn_color == 'white':
-            for i in range(coords[1], 8):
-                piece = game.board.get_piece_by_coordinates(coords[0], i)
-                if piece and piece.type == 'pawn' and piece.color == 'white':
-                    backward_pawns.add(pawn)
-                    break
-        else:
-            for i in range(coords[1] - 1, 0, -1):
-                # print("Trying to get piece by coordinates", coords[0], i)
-                piece = game.board.get_piece_by_coordinates(coords[0], i)
-                if piece and piece.type == 'pawn' and piece.color == 'black':
-                    backward_pawns.add(pawn)
-                    break
+        if color == 'white':
+            backward_pawns.add(board.squares[index])
+        # A black pawn needs another black pawn between it and rank 7 on its file
+        elif own_pawns & bitboard.FILE_MASKS[file] & ((1 << index) - 1) & ~0xff:
+            backward_pawns.add(board.squares[index])
     return backward_pawns
 
 
@@ -40,13 +41,12 @@ def get_doubled_pawns(game, color):
     Returns a list of all the doubled pawns for the given color.
     A pawn is considered doubled if there is another pawn of the same color on the same file.
     """
-    pawns = game.board.get_pieces_by_type_and_color('pawn', color)
-    pawn_positions = [pawn.position for pawn in pawns]
+    pawns = game.board.get_piece_mask('pawn', color)
     doubled_pawns = []
     for file in range(8):
-        pawns_on_file = [pos for pos in pawn_positions if pos[0] == file]
-        if len(pawns_on_file) > 1:
-            doubled_pawns += pawns_on_file
+        pawns_on_file = pawns & bitboard.FILE_MASKS[file]
+        if pawns_on_file & pawns_on_file - 1:
+            doubled_pawns += [util.index_to_coordinates(index) for index in bitboard.iterate_bits(pawns_on_file)]
     return doubled_pawns
 
 
@@ -55,89 +55,44 @@ def get_passed_pawns(game, color):
     Returns a list of all passed pawns for the given color.
     """
     passed_pawns = []
-    enemy_color = "white" if color == "black" else "black"
-    for file in range(8):
-        for rank in range(8):
-            piece = game.board.get_piece_by_coordinates(file, rank)
-            if piece is not None and piece.color == color and piece.type == "pawn":
-                if not is_passed_pawn(game, piece.square, enemy_color):
-                    continue
-                passed_pawns.append((file, rank))
+    pawns = get_pawn_mask(game)
+    for index in bitboard.iterate_bits(game.board.get_piece_mask('pawn', color)):
+        if is_passed_pawn(pawns, index, color):
+            passed_pawns.append(util.index_to_coordinates(index))
     return passed_pawns
 
 
-def is_passed_pawn(game, square, enemy_color):
+def is_passed_pawn(pawns, index, color):
     """
-    Returns True if the given pawn is passed, False otherwise.
+    Returns True if no pawn of either color stands in front of the pawn of the given color on the given board index,
+    on its own or an adjacent file. pawns is the mask of the pawns of both colors.
     """
-    file, rank = util.square_to_coordinates(square)
-    if enemy_color == 'white':
-        for i in range(rank + 1, 8):
-            if game.board.get_piece_by_coordinates(file, i) is not None:
-                return False
-        for i in range(rank + 1, 8):
-            for j in range(-1, 2):
-                if j == 0:
-                    continue
-                if (file + j) in range(8) and game.board.get_piece_by_coordinates(file + j, i) is not None:
-                    return False
-    else:
-        for i in range(rank - 1, -1, -1):
-            if game.board.get_piece_by_coordinates(file, i) is not None:
-                return False
-        for i in range(rank - 1, -1, -1):
-            for j in range(-1, 2):
-                if j == 0:
-                    continue
-                if (file + j) in range(8) and game.board.get_piece_by_coordinates(file + j, i) is not None:
-                    return False
-    return True
+    return not pawns & bitboard.FRONT_SPANS[color][index]
 
 
 def get_isolated_pawns(game, color):
     """
     Returns the number of isolated pawns for the given color.
     """
-    isolated_pawns = []
-
-    pawns = game.board.get_pieces_by_type_and_color('pawn', color)
-
-    for pawn in pawns:
-        pawn_file = pawn.position[0]
-        is_isolated = True
-        # check if there are any pawns of the same color on the adjacent files
-        for file_offset in [-1, 1]:
-            adjacent_file = pawn_file + file_offset
-            if adjacent_file < 0 or adjacent_file > 7:
-                continue
-            adjacent_pawns = game.board.get_pieces_by_type_and_file('pawn', color, adjacent_file)
-            if len(adjacent_pawns) > 0:
-                is_isolated = False
-                break
-        if is_isolated:
-            isolated_pawns.append(pawn)
-
-    return isolated_pawns
+    board = game.board
+    pawns = board.get_piece_mask('pawn', color)
+    # A pawn is isolated if there are no pawns of the same color on the adjacent files
+    return [board.squares[index] for index in bitboard.iterate_bits(pawns)
+            if not pawns & bitboard.ADJACENT_FILE_MASKS[index % 8]]
 
 
 def get_pawn_chains(game, color):
-    """Returns a list of pawn chains for the given color"""
+    """Returns a list of pawn chains for the given color, runs of pawns on neighbouring ranks of the same file"""
     pawn_chains = []
+    pawns = game.board.get_piece_mask('pawn', color)
     for file in range(8):
         chain = []
-        for rank in range(8):
-            piece = game.board.get_piece_by_coordinates(file, rank)
-            if piece and piece.type == 'pawn' and piece.color == color:
-                if not chain:
-                    chain.append((file, rank))
-                elif abs(rank - chain[-1][1]) == 1 and file == chain[-1][0]:
-                    chain.append((file, rank))
-                else:
-                    pawn_chains.append(chain)
-                    chain = [(file, rank)]
-            elif chain:
+        for index in bitboard.iterate_bits(pawns & bitboard.FILE_MASKS[file]):
+            rank = index // 8
+            if chain and rank != chain[-1][1] + 1:
                 pawn_chains.append(chain)
                 chain = []
+            chain.append((file, rank))
         if chain:
             pawn_chains.append(chain)
     return pawn_chains
@@ -182,11 +137,44 @@ def get_pawn_score(game, color):
     return pawn_score
 
 
+def get_pawn_move_count(index, color, occupancy):
+    """Returns the number of pushes and captures of the pawn of the given color on the given board index,
+    not checking whether they leave the own king in check"""
+    occupied = occupancy['white'] | occupancy['black']
+    step, start_ranks = (-8, range(48, 56)) if color == 'white' else (8, range(8, 16))
+    count = bitboard.count_bits(bitboard.PAWN_ATTACKS[color][index] & occupancy[util.get_opponent_color(color)])
+    # A pawn on the last rank promotes, so the square in front of any pawn is on the board
+    if not occupied & 1 << index + step:
+        count += 1
+        if index in start_ranks and not occupied & 1 << index + 2 * step:
+            count += 1
+    return count
+
+
+def get_eval_key(game):
+    """Returns the key of the game in the evaluation cache.
+    Besides the position the king safety depends on the game phase, which counts the minor pieces that moved,
+    so the same position reached with other pieces moved must not share an entry."""
+    if game.board.is_middle_game():
+        return game.hash ^ zobrist.MIDDLE_GAME_KEY
+    return game.hash
+
+
+def get_result_score(game):
+    """Returns the evaluation of a finished game, or None if the game is not over"""
+    if game.game_result == '1-0':
+        return 1000000
+    elif game.game_result == '0-1':
+        return -1000000
+    elif game.game_result == 'draw' or game.game_result == 'stalemate':
+        return 0
+    return None
+
+
 def get_material_score(game):
     """Returns the material balance of the board"""
     material_balance = 0
-    for square in game.board.board:
-        piece = game.board.get_piece_by_square(square)
+    for piece in game.board.squares:
         if piece is not None:
             if piece.color == 'white':
                 material_balance += piece.value * 100
@@ -196,99 +184,47 @@ def get_material_score(game):
 
 
 class Engine:
-    def __init__(self):
+    def __init__(self, pawn_hash_size=1, eval_cache_size=4):
         # Define constants
         self.MOBILITY_WEIGHT = 0.1
+        # Caches the pawn structure scores by the pawn hash of the game, pawn_hash_size is its memory size in MB
+        self.pawn_table = PawnHashTable(pawn_hash_size)
+        # Caches whole evaluations by the hash of the game, eval_cache_size is its memory size in MB, 0 turns it off
+        self.eval_cache = EvalCache(eval_cache_size) if eval_cache_size else None
         # Values for each piece type depending on the position on the board
-        self.POSITIONAL_VALUES = {
-            'pawn': [
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [50, 50, 50, 50, 50, 50, 50, 50],
-                [10, 10, 20, 30, 30, 20, 10, 10],
-                [5, 5, 10, 25, 25, 10, 5, 5],
-                [0, 0, 0, 20, 20, 0, 0, 0],
-                [5, -5, -10, 0, 0, -10, -5, 5],
-                [5, 10, 10, -20, -20, 10, 10, 5],
-                [0, 0, 0, 0, 0, 0, 0, 0]
-            ],
-            'knight': [
-                [-50, -40, -30, -30, -30, -30, -40, -50],
-                [-40, -20, 0, 0, 0, 0, -20, -40],
-                [-30, 0, 10, 15, 15, 10, 0, -30],
-                [-30, 5, 15, 20, 20, 15, 5, -30],
-                [-30, 0, 15, 20, 20, 15, 0, -30],
-                [-30, 5, 10, 15, 15, 10, 5, -30],
-                [-40, -20, 0, 5, 5, 0, -20, -40],
-                [-50, -40, -30, -30, -30, -30, -40, -50]
-            ],
-            'bishop': [
-                [-20, -10, -10, -10, -10, -10, -10, -20],
-                [-10, 0, 0, 0, 0, 0, 0, -10],
-                [-10, 0, 5, 10, 10, 5, 0, -10],
-                [-10, 5, 5, 10, 10, 5, 5, -10],
-                [-10, 0, 10, 10, 10, 10, 0, -10],
-                [-10, 10, 10, 10, 10, 10, 10, -10],
-                [-10, 5, 0, 0, 0, 0, 5, -10],
-                [-20, -10, -10, -10, -10, -10, -10, -20]
-            ],
-            'rook': [
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [5, 10, 10, 10, 10, 10, 10, 5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [-5, 0, 0, 0, 0, 0, 0, -5],
-                [0, 0, 0, 5, 5, 0, 0, 0]
-            ],
-            'queen': [
-                [-20, -10, -10, -5, -5, -10, -10, -20],
-                [-10, 0, 0, 0, 0, 0, 0, -10],
-                [-10, 0, 5, 5, 5, 5, 0, -10],
-                [-5, 0, 5, 5, 5, 5, 0, -5],
-                [0, 0, 5, 5, 5, 5, 0, -5],
-                [-10, 5, 5, 5, 5, 5, 0, -10],
-                [-10, 0, 5, 0, 0, 0, 0, -10],
-                [-20, -10, -10, -5, -5, -10, -10, -20]
-            ],
-            'king': [
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-30, -40, -40, -50, -50, -40, -40, -30],
-                [-20, -30, -30, -40, -40, -30, -30, -20],
-                [-10, -20, -20, -20, -20, -20, -20, -10],
-                [20, 20, 0, 0, 0, 0, 20, 20],
-                [20, 30, 10, 0, 0, 10, 30, 20]
-            ]
-        }
+        self.POSITIONAL_VALUES = piece_square.POSITIONAL_VALUES
 
     def evaluate_position(self, game):
-        if game.game_result == '1-0':
-            return 1000000
-        elif game.game_result == '0-1':
-            return -1000000
-        elif game.game_result == 'draw' or game.game_result == 'stalemate':
-            return 0
-        material_score = get_material_score(game)
+        result_score = get_result_score(game)
+        if result_score is not None:
+            return result_score
+        if self.eval_cache is not None:
+            cached_score = self.eval_cache.probe(get_eval_key(game))
+            if cached_score is not None:
+                return cached_score
+        # Kept up to date by the game as pieces move, get_material_score computes the same from scratch
+        material_score = game.material_score
+        # The same as get_positional_score for white minus black, also kept up to date by the game
+        positional_score = game.positional_score
+
+        total_score = material_score + positional_score + self.get_dynamic_score(game)
+
+        if self.eval_cache is not None:
+            self.eval_cache.store(get_eval_key(game), total_score / 100)
+        return total_score / 100
+
+    def get_dynamic_score(self, game):
+        """Returns the mobility, pawn structure and king safety terms of the evaluation, in centipawns.
+        Unlike material and piece-square values they depend on how the pieces stand to each other."""
         mobility_score = self.get_mobility_score(game)
-        white_pawn_score = get_pawn_score(game, 'white')
-        black_pawn_score = get_pawn_score(game, 'black')
-        pawn_score = black_pawn_score - white_pawn_score
+        pawn_score = self.get_pawn_structure_score(game)
         # print('Pawn score: {}'.format(pawn_score))
         white_king_safety_score = self.get_king_safety_score(game, 'white')
         # print('White king safety score: {}'.format(white_king_safety_score))
         black_king_safety_score = self.get_king_safety_score(game, 'black')
         # print('Black king safety score: {}'.format(black_king_safety_score))
         king_safety_score = white_king_safety_score - black_king_safety_score
-        white_positional_score = self.get_positional_score(game, 'white')
-        black_positional_score = self.get_positional_score(game, 'black')
-
-        positional_score = white_positional_score - black_positional_score
-
-        total_score = material_score + mobility_score + pawn_score + king_safety_score + positional_score
-
-        return total_score / 100
+        return mobility_score + pawn_score + king_safety_score
 
     def evaluate_for_maximizing_player(self, game):
         if game.current_player == 'white':
@@ -296,6 +232,14 @@ class Engine:
         else:
             return -self.evaluate_position(game)
 
+    def get_pawn_structure_score(self, game):
+        """Returns the pawn score of black minus the pawn score of white, from the pawn hash table if possible"""
+        pawn_score = self.pawn_table.probe(game.pawn_hash)
+        if pawn_score is None:
+            pawn_score = get_pawn_score(game, 'black') - get_pawn_score(game, 'white')
+            self.pawn_table.store(game.pawn_hash, pawn_score)
+        return pawn_score
+
     def get_mobility_score(self, game):
         """Returns the mobility score of the board"""
         white_mobility_score = self.get_mobility_score_for_color(game, 'white')
@@ -304,19 +248,27 @@ class Engine:
         return mobility_score
 
     def get_mobility_score_for_color(self, game, color):
-        """Returns the mobility score of the board for one player"""
-        switched = False
-        if color != game.current_player:
-            game.current_player = color
-            switched = True
-        mobility_score = 0
-        for square in game.board.board:
-            piece = game.board.get_piece_by_square(square)
-            if piece is not None and piece.color == color:
-                mobility_score += len(game.get_valid_moves_for_piece(piece.square))
-        mobility_score *= self.MOBILITY_WEIGHT
-        if switched:
-            game.current_player = util.get_opponent_color(color)
+        """Returns the mobility score of the board for one player.
+        Every piece counts the squares it attacks that are not occupied by its own pieces, pawns count their
+        pushes and captures. Legality is not checked, so the game is only read and never changed."""
+        occupancy = game.board.occupancy
+        occupied = occupancy['white'] | occupancy['black']
+        not_own = ~occupancy[color]
+        piece_indices = game.board.piece_squares[color]
+        attacked_squares = 0
+        for index in piece_indices['knight']:
+            attacked_squares += bitboard.count_bits(bitboard.KNIGHT_ATTACKS[index] & not_own)
+        for index in piece_indices['bishop']:
+            attacked_squares += bitboard.count_bits(bitboard.bishop_attacks(index, occupied) & not_own)
+        for index in piece_indices['rook']:
+            attacked_squares += bitboard.count_bits(bitboard.rook_attacks(index, occupied) & not_own)
+        for index in piece_indices['queen']:
+            attacked_squares += bitboard.count_bits(bitboard.queen_attacks(index, occupied) & not_own)
+        for index in piece_indices['king']:
+            attacked_squares += bitboard.count_bits(bitboard.KING_ATTACKS[index] & not_own)
+        for index in piece_indices['pawn']:
+            attacked_squares += get_pawn_move_count(index, color, occupancy)
+        mobility_score = attacked_squares * self.MOBILITY_WEIGHT
         # print('Mobility score for {}: {}'.format(color, mobility_score))
         return mobility_score
 
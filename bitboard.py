@@ -0,0 +1,116 @@
+# This file contains the bitboard helpers used by Board and the evaluation. A set of squares is stored as a 64-bit
+# integer mask. Bit i of a mask corresponds to board index i, so a8 is bit 0, h8 is bit 7, a1 is bit 56 and h1 is bit 63.
+# Board.set_piece keeps one mask per piece type and color and one occupancy mask per color up to date.
+# Knight, king and pawn attacks come from precomputed tables, slider attacks from precomputed rays.
+
+import util
+
+COLORS = ['white', 'black']
+
+
+def square_mask(index):
+    """Return a mask with only the bit of the given board index set"""
+    return 1 << index
+
+
+def iterate_bits(mask):
+    """Yield the board indices of all set bits in the given mask, lowest index first"""
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+def count_bits(mask):
+    """Return the number of set bits in the given mask"""
+    return bin(mask).count('1')
+
+
+def _targets_to_masks(targets):
+    """Convert a per-square list of target indices into a per-square attack mask"""
+    masks = []
+    for square_targets in targets:
+        mask = 0
+        for target in square_targets:
+            mask |= 1 << target
+        masks.append(mask)
+    return masks
+
+
+KNIGHT_ATTACKS = _targets_to_masks(util.KNIGHT_TARGETS)
+KING_ATTACKS = _targets_to_masks(util.KING_TARGETS)
+PAWN_ATTACKS = {color: _targets_to_masks(util.PAWN_ATTACK_TARGETS[color]) for color in COLORS}
+# RAY_ATTACKS[direction][index] is the mask of all squares along the ray from index to the board edge
+RAY_ATTACKS = [_targets_to_masks([util.RAYS[index][direction] for index in range(64)])
+               for direction in range(len(util.RAY_DIRECTIONS))]
+# Rays pointing towards higher board indices find their nearest blocker in the lowest set bit,
+# rays pointing towards lower board indices in the highest set bit
+RAY_IS_POSITIVE = [dy * 8 + dx > 0 for dx, dy in util.RAY_DIRECTIONS]
+ORTHOGONAL_DIRECTIONS = [0, 1, 2, 3]
+DIAGONAL_DIRECTIONS = [4, 5, 6, 7]
+
+
+def ray_attacks(index, occupied, directions):
+    """Return the mask of squares attacked from index along the given directions,
+    stopping at (and including) the first occupied square in each direction"""
+    attacks = 0
+    for direction in directions:
+        ray = RAY_ATTACKS[direction][index]
+        blockers = ray & occupied
+        if blockers:
+            if RAY_IS_POSITIVE[direction]:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= RAY_ATTACKS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def bishop_attacks(index, occupied):
+    return ray_attacks(index, occupied, DIAGONAL_DIRECTIONS)
+
+
+def rook_attacks(index, occupied):
+    return ray_attacks(index, occupied, ORTHOGONAL_DIRECTIONS)
+
+
+def queen_attacks(index, occupied):
+    return ray_attacks(index, occupied, ORTHOGONAL_DIRECTIONS + DIAGONAL_DIRECTIONS)
+
+
+def get_piece_attacks(piece_type, color, index, occupied):
+    """Return the mask of squares a piece of the given type and color on index attacks,
+    with sliders stopping at the given occupancy"""
+    if piece_type == 'pawn':
+        return PAWN_ATTACKS[color][index]
+    if piece_type == 'knight':
+        return KNIGHT_ATTACKS[index]
+    if piece_type == 'king':
+        return KING_ATTACKS[index]
+    if piece_type == 'bishop':
+        return bishop_attacks(index, occupied)
+    if piece_type == 'rook':
+        return rook_attacks(index, occupied)
+    return queen_attacks(index, occupied)
+
+
+# FILE_MASKS[file] is the mask of all squares on the file, ADJACENT_FILE_MASKS[file] of the files next to it
+FILE_MASKS = [sum(1 << (y * 8 + file) for y in range(8)) for file in range(8)]
+ADJACENT_FILE_MASKS = [(FILE_MASKS[file - 1] if file > 0 else 0) | (FILE_MASKS[file + 1] if file < 7 else 0)
+                       for file in range(8)]
+
+
+def _build_front_spans(color):
+    """Return the mask of the squares in front of a pawn of the given color on every board index,
+    on its own file and the adjacent files, up to the last rank"""
+    spans = []
+    for index in range(64):
+        rank_start = index - index % 8
+        # White pawns move towards board index 0, black pawns towards 63
+        ahead = (1 << rank_start) - 1 if color == 'white' else ~((1 << (rank_start + 8)) - 1)
+        spans.append(ahead & (FILE_MASKS[index % 8] | ADJACENT_FILE_MASKS[index % 8]))
+    return spans
+
+
+FRONT_SPANS = {color: _build_front_spans(color) for color in COLORS}
@@ -3,46 +3,48 @@
 # and checking game status (e.g., checkmate, stalemate).
 
 from piece import *
+import bitboard
+
+PIECE_TYPES = ['pawn', 'knight', 'bishop', 'rook', 'queen', 'king']
+
+# Piece types that can slide along the orthogonal and the diagonal ray directions
+ORTHOGONAL_SLIDERS = ('rook', 'queen')
+DIAGONAL_SLIDERS = ('bishop', 'queen')
+
+# The piece classes by their FEN letter, and the letters of the pieces on every square of the starting position
+PIECE_CLASSES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+START_LETTERS = 'rnbqkbnr' + 'p' * 8 + ' ' * 32 + 'P' * 8 + 'RNBQKBNR'
 
 
 class Board:
     def __init__(self):
-        # Initialize the board as an empty dictionary
-        self.board = {"a1": Rook("white", 0, 7), "b1": Knight("white", 1, 7), "c1": Bishop("white", 2, 7),
-                      "d1": Queen("white", 3, 7), "e1": King("white", 4, 7), "f1": Bishop("white", 5, 7),
-                      "g1": Knight("white", 6, 7), "h1": Rook("white", 7, 7),
-                      "a8": Rook("black", 0, 0), "b8": Knight("black", 1, 0), "c8": Bishop("black", 2, 0),
-                      "d8": Queen("black", 3, 0), "e8": King("black", 4, 0), "f8": Bishop("black", 5, 0),
-                      "g8": Knight("black", 6, 0), "h8": Rook("black", 7, 0)}
-        # Add the pieces to the board using the squares they start on as keys
-        for i in range(8):
-            self.board[f"{chr(ord('a') + i)}2"] = Pawn("white", i, 6)
-        for i in range(8):
-            self.board[f"{chr(ord('a') + i)}7"] = Pawn("black", i, 1)
-        # Add the empty squares to the board
-        for y in range(2, 6):
-            for x in range(8):
-                self.board[f"{chr(ord('a') + x)}{y + 1}"] = None
+        # Initialize the board as a flat list of 64 squares, indexed from a8 (0) to h1 (63).
+        # The index of the square with coordinates (x, y) is y * 8 + x.
+        self.squares = [None] * 64
+        # The board indices of the pieces of every color and type and of both kings,
+        # kept up to date by set_piece and remove_piece like the masks below
+        self.piece_squares = {color: {piece_type: set() for piece_type in PIECE_TYPES}
+                              for color in ('white', 'black')}
+        self.king_squares = {'white': None, 'black': None}
+        # The bitboards of every color and type and the occupancy mask of every color,
+        # bit i of a mask is set if such a piece stands on board index i
+        self.piece_masks = {color: {piece_type: 0 for piece_type in PIECE_TYPES} for color in ('white', 'black')}
+        self.occupancy = {'white': 0, 'black': 0}
+        back_rank = [Rook, Knight, Bishop, Queen, King, Bishop, Knight, Rook]
+        # Add the pieces to the board on the squares they start on
+        for x in range(8):
+            self.set_piece(x, back_rank[x]("black", x, 0))
+            self.set_piece(8 + x, Pawn("black", x, 1))
+            self.set_piece(48 + x, Pawn("white", x, 6))
+            self.set_piece(56 + x, back_rank[x]("white", x, 7))
 
     def __str__(self):
         """Return a string representation of the board.
-        Because the board is represented as a dictionary, we have to print it in a specific order.
-        The board is printed from the white player's perspective."""
-
-        # Create a list of the squares on the board
-        rows = []
-        # Iterate over the squares from a1 to h8
-        for y in range(8):
-            row = []
-            for x in range(8):
-                row.append(f"{chr(ord('a') + x)}{8 - y}")
-            rows.append(row)
-        # Create a string representation of the board
+        The board is printed from the white player's perspective, starting with rank 8."""
         ranks = ['']
-        for row in rows:
+        for y in range(8):
             rank = []
-            for square in row:
-                piece = self.get_piece_by_square(square)
+            for piece in self.squares[y * 8:y * 8 + 8]:
                 if piece:
                     rank.append(piece.letter)
                 else:
@@ -52,14 +54,18 @@ class Board:
 
     def get_piece_by_square(self, square):
         """Return the piece at the given position"""
-        return self.board[square]
+        return self.squares[util.SQUARE_INDICES[square]]
+
+    def get_piece_by_index(self, index):
+        """Return the piece at the given board index"""
+        return self.squares[index]
 
     def count_pieces(self):
         """Count the number of pieces on the board"""
         total_pieces = 0
-        for square in self.board:
-            if self.board[square]:
-                total_pieces += 1
+        for color_squares in self.piece_squares.values():
+            for indices in color_squares.values():
+                total_pieces += len(indices)
         return total_pieces
 
     def is_middle_game(self):
@@ -106,47 +112,51 @@ class Board:
         return False
 
     def get_piece_by_coordinates(self, x, y):
-        """Return the piece at the given position"""
-        square = util.coordinates_to_square(x, y)
-        return self.get_piece_by_square(square)
+        """Return the piece at the given position.
+        Raises a KeyError for coordinates outside the board."""
+        if 0 <= x < 8 and 0 <= y < 8:
+            return self.squares[y * 8 + x]
+        raise KeyError((x, y))
 
     def get_pieces_by_type(self, piece_type):
         """Return a list of all pieces of the given type"""
-        pieces = []
-        for square in self.board:
-            piece = self.get_piece_by_square(square)
-            if piece and piece.type == piece_type:
-                pieces.append(piece)
-        return pieces
+        return self.get_pieces_by_type_and_color(piece_type, 'white') + \
+            self.get_pieces_by_type_and_color(piece_type, 'black')
 
     def get_pieces_by_type_and_color(self, piece_type, color):
         """Return a list of all pieces of the given type"""
-        pieces = []
-        for square in self.board:
-            piece = self.get_piece_by_square(square)
-            if piece and piece.type == piece_type and piece.color == color:
-                pieces.append(piece)
-        return pieces
+        return [self.squares[index] for index in self.piece_squares[color][piece_type]]
 
     def get_pieces_by_type_and_file(self, piece_type, color, file):
         """Return a list of all pieces of the given type and file"""
-        pieces = []
-        for square in self.board:
-            piece = self.get_piece_by_square(square)
-            if piece and piece.type == piece_type and piece.color == color and piece.position[0] == file:
-                pieces.append(piece)
-        return pieces
+        return [self.squares[index] for index in self.piece_squares[color][piece_type] if index % 8 == file]
 
     def set_piece(self, square, piece):
-        """Set the piece at the given position"""
-        self.board[square] = piece
+        """Set the piece at the given position (a board index or an algebraic square)"""
+        if isinstance(square, str):
+            square = util.SQUARE_INDICES[square]
+        old_piece = self.squares[square]
+        if old_piece is not None:
+            self.piece_squares[old_piece.color][old_piece.type].discard(square)
+            self.piece_masks[old_piece.color][old_piece.type] &= ~(1 << square)
+            self.occupancy[old_piece.color] &= ~(1 << square)
+            if old_piece.type == 'king' and self.king_squares[old_piece.color] == square:
+                self.king_squares[old_piece.color] = None
+        self.squares[square] = piece
+        if piece is not None:
+            self.piece_squares[piece.color][piece.type].add(square)
+            self.piece_masks[piece.color][piece.type] |= 1 << square
+            self.occupancy[piece.color] |= 1 << square
+            if piece.type == 'king':
+                self.king_squares[piece.color] = square
 
     def remove_piece(self, square):
-        """Remove the piece at the given position"""
-        self.board[square] = None
+        """Remove the piece at the given position (a board index or an algebraic square)"""
+        self.set_piece(square, None)
 
-    def move_piece(self, start, end):
-        """Move the piece from the start position to the end position"""
+    def move_piece(self, start, end, promotion='q'):
+        """Move the piece from the start position to the end position.
+        A pawn reaching the last rank is promoted to the piece with the given letter, a queen by default."""
         piece = self.get_piece_by_square(start)
         captured_piece = self.get_piece_by_square(end)
         self.set_piece(start, None)
@@ -155,42 +165,100 @@ class Board:
         # if the move is a promotion
         if piece.type == 'pawn':
             if piece.color == 'white' and end[1] == '8':
-                self.promote_pawn(end, 'q', piece.color)
+                self.promote_pawn(end, promotion, piece.color)
             elif piece.color == 'black' and end[1] == '1':
-                self.promote_pawn(end, 'q', piece.color)
+                self.promote_pawn(end, promotion, piece.color)
         return captured_piece
 
     def promote_pawn(self, square, target_piece, color):
         self.remove_piece(square)
-        x = util.square_to_coordinates(square)[0]
-        y = util.square_to_coordinates(square)[1]
+        x, y = util.square_to_coordinates(square)
         if target_piece == 'q':
-            self.board[square] = Queen(color, x, y)
+            self.set_piece(square, Queen(color, x, y))
+        elif target_piece == 'r':
+            self.set_piece(square, Rook(color, x, y))
+        elif target_piece == 'b':
+            self.set_piece(square, Bishop(color, x, y))
+        elif target_piece == 'n':
+            self.set_piece(square, Knight(color, x, y))
 
     def get_king_position(self, color):
         """Return the position of the given player's king"""
-        for square in self.board:
-            piece = self.get_piece_by_square(square)
-            if piece is not None and piece.color == color and piece.type == 'king':
-                return piece.position
+        index = self.king_squares[color]
+        if index is None:
+            return None
+        return util.index_to_coordinates(index)
 
     def get_all_pieces(self, color):
         """Return a list of all the pieces of the given color"""
-        pieces = []
-        for square in self.board:
-            piece = self.get_piece_by_square(square)
-            if piece is not None and piece.color == color:
-                pieces.append(piece)
-        return pieces
+        return [self.squares[index] for index in self.get_indices_by_color(color)]
 
     def get_pieces_by_color(self, color):
         """Return a list of all the positions of the pieces of the given color"""
-        positions = []
-        for square in self.board:
-            piece = self.get_piece_by_square(square)
-            if piece is not None and piece.color == color:
-                positions.append(square)
-        return positions
+        return [util.SQUARE_NAMES[index] for index in self.get_indices_by_color(color)]
+
+    def get_indices_by_color(self, color):
+        """Return a list of the board indices of all the pieces of the given color"""
+        indices = []
+        for piece_indices in self.piece_squares[color].values():
+            indices.extend(piece_indices)
+        return indices
+
+    def get_piece_mask(self, piece_type, color):
+        """Return the bitboard of all pieces of the given type and color"""
+        return self.piece_masks[color][piece_type]
+
+    def get_occupancy(self, color=None):
+        """Return the occupancy mask of the given color, or of both colors if no color is given"""
+        if color is None:
+            return self.occupancy['white'] | self.occupancy['black']
+        return self.occupancy[color]
+
+    def get_attacks(self, index):
+        """Return the mask of squares attacked by the piece on the given board index (0 if it is empty)"""
+        piece = self.squares[index]
+        if piece is None:
+            return 0
+        return bitboard.get_piece_attacks(piece.type, piece.color, index, self.get_occupancy())
+
+    def get_attackers_mask(self, square, by_color, occupied=None):
+        """Return the mask of all pieces of the given color attacking the given board index.
+        occupied is the occupancy the slider attacks are computed with, both colors by default."""
+        if occupied is None:
+            occupied = self.occupancy['white'] | self.occupancy['black']
+        masks = self.piece_masks[by_color]
+        # A pawn of by_color attacks the square if a pawn of the other color on the square would attack it back
+        attackers = bitboard.PAWN_ATTACKS[util.get_opponent_color(by_color)][square] & masks['pawn']
+        attackers |= bitboard.KNIGHT_ATTACKS[square] & masks['knight']
+        attackers |= bitboard.KING_ATTACKS[square] & masks['king']
+        attackers |= bitboard.bishop_attacks(square, occupied) & (masks['bishop'] | masks['queen'])
+        attackers |= bitboard.rook_attacks(square, occupied) & (masks['rook'] | masks['queen'])
+        return attackers
+
+    def is_attacked(self, square, by_color, occupied=None):
+        """Return True if the given square (a board index or an algebraic square) is attacked by any piece
+        of the given color. The leapers are looked up first, the sliders only if none of them attacks.
+        occupied is the occupancy the slider attacks are computed with, both colors by default."""
+        if isinstance(square, str):
+            square = util.SQUARE_INDICES[square]
+        masks = self.piece_masks[by_color]
+        if bitboard.PAWN_ATTACKS[util.get_opponent_color(by_color)][square] & masks['pawn'] or \
+                bitboard.KNIGHT_ATTACKS[square] & masks['knight'] or bitboard.KING_ATTACKS[square] & masks['king']:
+            return True
+        if occupied is None:
+            occupied = self.occupancy['white'] | self.occupancy['black']
+        diagonal_sliders = masks['bishop'] | masks['queen']
+        if diagonal_sliders and bitboard.bishop_attacks(square, occupied) & diagonal_sliders:
+            return True
+        orthogonal_sliders = masks['rook'] | masks['queen']
+        return bool(orthogonal_sliders and bitboard.rook_attacks(square, occupied) & orthogonal_sliders)
+
+    def get_attackers(self, square, by_color):
+        """Return the board indices of all pieces of the given color attacking the given square
+        (a board index or an algebraic square)"""
+        if isinstance(square, str):
+            square = util.SQUARE_INDICES[square]
+        return list(bitboard.iterate_bits(self.get_attackers_mask(square, by_color)))
 
     def get_all_moves(self, player):
         """Return a list of all the legal moves for the given player
@@ -206,8 +274,7 @@ class Board:
         fen = ''
         for y in range(8):
             empty_squares = 0
-            for x in range(8):
-                piece = self.get_piece_by_coordinates(x, y)
+            for piece in self.squares[y * 8:y * 8 + 8]:
                 if piece:
                     if empty_squares:
                         fen += str(empty_squares)
@@ -220,3 +287,21 @@ class Board:
             if y != 7:
                 fen += '/'
         return fen
+
+    def set_fen(self, fen):
+        """Set up the board from the piece placement field of a FEN string.
+        Pieces that are not on the square they start the game on are marked as moved."""
+        for index in range(64):
+            self.set_piece(index, None)
+        for y, rank in enumerate(fen.split('/')):
+            x = 0
+            for letter in rank:
+                if letter.isdigit():
+                    x += int(letter)
+                    continue
+                color = 'white' if letter.isupper() else 'black'
+                piece = PIECE_CLASSES[letter.lower()](color, x, y)
+                index = y * 8 + x
+                piece.moved = START_LETTERS[index] != letter
+                self.set_piece(index, piece)
+                x += 1
@@ -1,4 +1,5 @@
 from game import Game
+import move_encoding
 from minimax import Minimax
 from mmax import Negamax
 import argparse
@@ -8,15 +9,31 @@ import argparse
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Test the chess engine.')
-    parser.add_argument('--depth', type=int, default=10, help='The depth of the minimax algorithm.')
-    parser.add_argument('--threads', type=int, default=4, help='The number of threads to use.')
+    parser.add_argument('--depth', type=int, default=10, help='The maximum depth of the minimax algorithm.')
+    parser.add_argument('--movetime', type=int, default=5000, help='The time to search each move for in ms.')
+    parser.add_argument('--nodes', type=int, default=None, help='The maximum number of nodes to search each move.')
+    parser.add_argument('--threads', type=int, default=4, help='The number of processes to search with.')
+    parser.add_argument('--hash', type=int, default=16,
+                        help='The size of the transposition tables of all processes together in MB.')
+    parser.add_argument('--stats', type=str, default=None,
+                        help='A file to append the search statistics of every depth to as JSON lines.')
+    parser.add_argument('--multipv', type=int, default=1,
+                        help='The number of best lines to show before the engine moves.')
+    parser.add_argument('--ponder', action='store_true',
+                        help='Search the expected reply while waiting for the next move.')
+    parser.add_argument('--no-null-move', action='store_true', help='Turn off null move pruning.')
+    parser.add_argument('--no-lmr', action='store_true', help='Turn off late move reductions.')
+    parser.add_argument('--no-futility', action='store_true', help='Turn off futility pruning.')
+    parser.add_argument('--no-razoring', action='store_true', help='Turn off razoring.')
     args = parser.parse_args()
     depth = args.depth
     threads = args.threads
     # Initialize the game
     game = Game()
-    # minimax = Negamax(depth)
-    minimax = Minimax(depth, threads)
+    stats_output = open(args.stats, 'a') if args.stats else None
+    selectivity = (not args.no_null_move, not args.no_lmr, not args.no_futility, not args.no_razoring)
+    # minimax = Negamax(depth, args.hash, stats_output, *selectivity)
+    minimax = Minimax(depth, threads, args.hash, stats_output, *selectivity)
 
     # Play the game
     while not game.is_game_over():
@@ -25,11 +42,22 @@ if __name__ == "__main__":
         choice = input('Enter your move, "x" to let the engine make a move or "q" to quit: ')
 
         if choice == 'q':
+            minimax.stop_pondering()
             break
         elif choice == 'x':
             print('Calculating best move...')
-            move = minimax.search(game)
-            game.make_move(move[0], move[1])
+            if args.multipv > 1:
+                lines = minimax.search_multipv(game, args.multipv, movetime=args.movetime, nodes=args.nodes)
+                for line in lines:
+                    print(f'depth {line.depth} score {line.score:.2f} pv',
+                          ' '.join(move_encoding.to_uci(move) for move in line.pv))
+                move = lines[0].move
+            else:
+                move = minimax.search(game, movetime=args.movetime, nodes=args.nodes)
+            start, end = move_encoding.to_tuple(move)
+            game.make_move(start, end, move_encoding.get_promotion(move))
+            if args.ponder and len(minimax.pv) > 1:
+                minimax.ponder(game, minimax.pv[1])
         else:
             try:
                 move = choice.split(' ')
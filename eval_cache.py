@@ -0,0 +1,52 @@
+# This file contains the evaluation cache of Engine.
+# The same positions are evaluated over and over: by every iteration of iterative deepening, by the static
+# evaluation and the quiescence search of the same node, by MCTS simulations reaching the same leaves and by
+# the GUI. The cache stores the evaluation of a position under its Zobrist hash, which covers the pieces,
+# the side to move, the castling rights and the en passant file, so a hit skips the whole evaluation.
+# Every slot holds the two entries used most recently. A new entry pushes out the one used least recently.
+
+# Rough memory use of one slot in bytes, two (key, score) tuples with their list slots
+ENTRY_SIZE = 200
+
+
+class EvalCache:
+    def __init__(self, size_mb=4):
+        self.size = max(1, size_mb * 1024 * 1024 // ENTRY_SIZE)
+        self.recent = [None] * self.size
+        self.older = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """Return the evaluation stored for the given position hash, or None if there is none"""
+        index = key % self.size
+        entry = self.recent[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        entry = self.older[index]
+        if entry is not None and entry[0] == key:
+            # Used again, so it is now the most recent entry of its slot
+            self.older[index] = self.recent[index]
+            self.recent[index] = entry
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        """Store the evaluation of the position with the given hash"""
+        index = key % self.size
+        self.older[index] = self.recent[index]
+        self.recent[index] = (key, score)
+
+    def get_hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        self.recent = [None] * self.size
+        self.older = [None] * self.size
+        self.hits = 0
+        self.misses = 0
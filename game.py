@@ -3,17 +3,41 @@
 # checking game status.
 
 import copy
+from collections import namedtuple
 
+import move_encoding
+import movegen
+import piece_square
 import util
+import zobrist
 from board import Board
 
+# Everything push() changes that cannot be recomputed when the move is taken back with pop()
+UndoRecord = namedtuple('UndoRecord', [
+    'move', 'piece', 'moved', 'captured_piece', 'captured_square', 'rook_move', 'rook_moved',
+    'castling_rights', 'en_passant_square', 'half_move_clock', 'full_move_number',
+    'white_king_pos', 'black_king_pos', 'game_result', 'attackers', 'hash', 'pawn_hash', 'scores'])
+
+# The fifty move rule counts moves of both players, so it draws after this many half moves
+FIFTY_MOVE_PLIES = 100
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# The castling right that is lost when a rook leaves or is captured on one of these squares
+CASTLING_ROOK_SQUARES = {
+    'a1': ('white', 'Q'),
+    'h1': ('white', 'K'),
+    'a8': ('black', 'Q'),
+    'h8': ('black', 'K')
+}
+
 
 class Game:
     def __init__(self):
         self.board = Board()
         self.current_player = 'white'
         self.move_history = []
-        self.fen_history = []
+        self.hash_history = []  # Zobrist hashes of all earlier positions, used to detect repetitions
         self.half_move_clock = 0
         self.full_move_number = 1
         self.white_king_pos = (4, 7)
@@ -35,88 +59,80 @@ class Game:
             }
         }
         self.game_result = None
-
-    def make_move(self, start, end):
-        """Make a move on the board and update the game state"""
+        self.en_passant_square = None  # Board index a pawn can be captured on en passant, if any
+        self.undo_stack = []  # Undo records of the moves made with push()
+        self.hash = zobrist.compute_hash(self)  # Zobrist hash of the current position
+        self.pawn_hash = zobrist.compute_pawn_hash(self.board)  # Zobrist hash of the pawns only
+        # Running totals of the evaluation, see piece_square
+        self.material_score, self.positional_score = piece_square.compute_scores(self.board)
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Return a game set up in the position of the given FEN string.
+        The clocks are optional, the en passant square is only kept if a pawn can capture on it."""
+        fields = fen.split()
+        game = cls()
+        game.board.set_fen(fields[0])
+        game.current_player = 'white' if fields[1] == 'w' else 'black'
+        castling = fields[2] if len(fields) > 2 else '-'
+        game.castling_rights = {
+            'white': {'K': 'K' in castling, 'Q': 'Q' in castling},
+            'black': {'K': 'k' in castling, 'Q': 'q' in castling}
+        }
+        if len(fields) > 3 and fields[3] != '-':
+            square = util.square_to_index(fields[3])
+            # The pawn that moved two squares passed over the en passant square from its own side
+            step = 8 if game.current_player == 'black' else -8
+            game.en_passant_square = game.get_en_passant_square(
+                util.get_opponent_color(game.current_player), square + step, square - step)
+        if len(fields) > 5:
+            game.half_move_clock = int(fields[4])
+            game.full_move_number = int(fields[5])
+        game.white_king_pos = game.board.get_king_position('white')
+        game.black_king_pos = game.board.get_king_position('black')
+        game.hash = zobrist.compute_hash(game)
+        game.pawn_hash = zobrist.compute_pawn_hash(game.board)
+        game.material_score, game.positional_score = piece_square.compute_scores(game.board)
+        return game
+
+    def to_fen(self):
+        """Return the FEN string of the current position"""
+        castling = ''
+        for color, sides in (('white', 'KQ'), ('black', 'kq')):
+            for side in sides:
+                if self.castling_rights[color][side.upper()]:
+                    castling += side
+        en_passant = '-'
+        if self.en_passant_square is not None:
+            en_passant = util.SQUARE_NAMES[self.en_passant_square]
+        return ' '.join([self.board.get_fen(), self.current_player[0], castling or '-', en_passant,
+                         str(self.half_move_clock), str(self.full_move_number)])
+
+    def make_move(self, start, end, promotion=None):
+        """Make a move on the board and update the game state.
+        A pawn reaching the last rank promotes to the given piece type, a queen if none is given."""
         # Get the piece at the start position
-        captured_piece = None
         piece = self.board.get_piece_by_square(start)
         if piece is None:
             print('No piece at start position, was given move: ' + start + end)
             print('In board state', self.board)
-            print('With move history', self.move_history)
-
-        # Update the move history
-        self.move_history.append((start, end))
-
-        # Update the FEN history
-        self.fen_history.append(self.board.get_fen())
-
-        # Update the captured piece
-        # If the moved piece is not a pawn:
-        if piece.type != 'pawn':
-            captured_piece = self.board.get_piece_by_square(end)
-        elif piece.type == 'pawn' and self.board.get_piece_by_square(end) is not None:
-            captured_piece = self.board.get_piece_by_square(end)
-        elif piece.type == 'pawn' and self.board.get_piece_by_square(end) is None and (end[0] != start[0]):
-            captured_piece_coordinates = util.square_to_coordinates(end)[0], util.square_to_coordinates(start)[1]
-            captured_piece_square = util.coordinates_to_square(
-                captured_piece_coordinates[0], captured_piece_coordinates[1])
-            captured_piece = self.board.get_piece_by_square(captured_piece_square)
-            self.board.remove_piece(captured_piece_square)
+            print('With move history', self.get_move_history())
 
-        # Make the move
-        self.board.move_piece(start, end)
+        castling = piece.type == 'king' and abs(ord(start[0]) - ord(end[0])) == 2
 
-        castling = False
+        # Make the move
+        self.push(move_encoding.from_tuple(self.board, (start, end), promotion))
+        captured_piece = self.undo_stack[-1].captured_piece
 
         # If the move was a pawn promotion
-        if piece.type == 'pawn':
-            if self.current_player == 'white':
-                if end[1] == '8':
-                    self.promotion = True
-            else:
-                if end[1] == '1':
-                    self.promotion = True
-
-        # If the move is a castling move
-        if piece.type == 'king' and abs(ord(start[0]) - ord(end[0])) == 2:
-            castling = True
-            if start == 'e1':
-                if end == 'g1':
-                    self.board.move_piece('h1', 'f1')
-                else:
-                    self.board.move_piece('a1', 'd1')
-            else:
-                if end == 'g8':
-                    self.board.move_piece('h8', 'f8')
-                else:
-                    self.board.move_piece('a8', 'd8')
+        self.promotion = piece.type == 'pawn' and end[1] in '18'
 
-        self.white_king_pos = self.board.get_king_position('white')
-        self.black_king_pos = self.board.get_king_position('black')
         self.update_attackers('white')
         self.update_attackers('black')
 
-        if captured_piece is not None or piece.type == 'pawn':
-            self.half_move_clock = 0
-        else:
-            self.half_move_clock += 1
-
-        # Switch players
-        if self.current_player == 'white':
-            self.current_player = 'black'
-        else:
-            self.current_player = 'white'
-
         self.update_game_result()
 
         # Update the PGN
-        # print("Updating PGN")
-        # print("Piece was a", piece.type, "of color", piece.color)
-        # print("Move was", start, "to", end)
-        # print("Captured piece was", captured_piece)
-        # print("Current player is", self.current_player)
         if self.current_player == 'black':
             self.pgn += str(self.full_move_number) + '. '
         if castling:
@@ -135,7 +151,7 @@ class Game:
                 self.pgn += 'x'
             self.pgn += end
             if self.promotion:
-                self.pgn += '=Q'
+                self.pgn += '=' + self.board.get_piece_by_square(end).letter.upper()
             if self.is_checkmate():
                 self.pgn += '#'
             else:
@@ -144,174 +160,230 @@ class Game:
 
         self.pgn += ' '
 
-        # Update the full move number
-        if self.current_player == 'white':
-            self.full_move_number += 1
-
-        # Update castling rights
-        if piece.type == 'king':
-            self.castling_rights[piece.color]['K'] = False
-            self.castling_rights[piece.color]['Q'] = False
-            # print('King moved, castling rights for', piece.color, 'are now', self.castling_rights[piece.color])
-        elif piece.type == 'rook':
-            if piece.color == 'white':
-                if piece.position[0] == 0:
-                    self.castling_rights['white']['Q'] = False
-                elif piece.position[0] == 7:
-                    self.castling_rights['white']['K'] = False
-            else:
-                if piece.position[0] == 0:
-                    self.castling_rights['black']['Q'] = False
-                elif piece.position[0] == 7:
-                    self.castling_rights['black']['K'] = False
-
         return True
 
     def apply_move(self, start, end):
-        """Make a move on the board and update the game state"""
+        """Return a copy of the game with the given move made on it.
+        Prefer push() and pop() when walking a search tree, they avoid copying the game."""
         state = copy.deepcopy(self)
-        # Get the piece at the start position
-        captured_piece = None
-        piece = state.board.get_piece_by_square(start)
-        if piece is None:
-            print('No piece at start position, was given move: ' + start + end)
-            print('In board state', state.board)
-            print('With move history', state.move_history)
-
-        # Update the move history
-        state.move_history.append((start, end))
-
-        # Update the FEN history
-        state.fen_history.append(state.board.get_fen())
-
-        # Update the captured piece
-        # If the moved piece is not a pawn:
-        if piece.type != 'pawn':
-            captured_piece = state.board.get_piece_by_square(end)
-        elif piece.type == 'pawn' and state.board.get_piece_by_square(end) is not None:
-            captured_piece = state.board.get_piece_by_square(end)
-        elif piece.type == 'pawn' and state.board.get_piece_by_square(end) is None and (end[0] != start[0]):
-            captured_piece_coordinates = util.square_to_coordinates(end)[0], util.square_to_coordinates(start)[1]
-            captured_piece_square = util.coordinates_to_square(
-                captured_piece_coordinates[0], captured_piece_coordinates[1])
-            captured_piece = state.board.get_piece_by_square(captured_piece_square)
-            state.board.remove_piece(captured_piece_square)
-
-        # Make the move
-        state.board.move_piece(start, end)
-
-        castling = False
+        state.make_move(start, end)
+        return state
 
-        # If the move was a pawn promotion
-        if piece.type == 'pawn':
-            if state.current_player == 'white':
-                if end[1] == '8':
-                    state.promotion = True
-            else:
-                if end[1] == '1':
-                    state.promotion = True
-
-        # If the move is a castling move
-        if piece.type == 'king' and abs(ord(start[0]) - ord(end[0])) == 2:
-            castling = True
-            if start == 'e1':
-                if end == 'g1':
-                    state.board.move_piece('h1', 'f1')
-                else:
-                    state.board.move_piece('a1', 'd1')
+    def push(self, move):
+        """Make a move encoded by the move_encoding module and record how to take it back with pop().
+        Only the position is updated (board, side to move, castling rights, en passant square, clocks,
+        king positions, hashes and evaluation totals), the PGN and game result are left to make_move."""
+        board = self.board
+        start_index = move & move_encoding.START_MASK
+        end_index = move >> move_encoding.END_SHIFT & move_encoding.START_MASK
+        start = util.SQUARE_NAMES[start_index]
+        end = util.SQUARE_NAMES[end_index]
+        piece = board.squares[start_index]
+        captured_piece = board.squares[end_index]
+        captured_square = end
+        rook_move = None
+        rook_moved = False
+
+        # Remove a pawn captured en passant, it is not on the target square
+        if move & move_encoding.EN_PASSANT:
+            captured_square = util.SQUARE_NAMES[start_index - start_index % 8 + end_index % 8]
+            captured_piece = board.get_piece_by_square(captured_square)
+            board.remove_piece(captured_square)
+
+        # If the move is a castling move, the rook has to move as well
+        if move & move_encoding.CASTLE:
+            if end_index > start_index:
+                rook_move = (util.SQUARE_NAMES[start_index + 3], util.SQUARE_NAMES[start_index + 1])
             else:
-                if end == 'g8':
-                    state.board.move_piece('h8', 'f8')
-                else:
-                    state.board.move_piece('a8', 'd8')
+                rook_move = (util.SQUARE_NAMES[start_index - 4], util.SQUARE_NAMES[start_index - 1])
+            rook_moved = board.get_piece_by_square(rook_move[0]).moved
+
+        self.undo_stack.append(UndoRecord(
+            move, piece, piece.moved, captured_piece, captured_square, rook_move, rook_moved,
+            (self.castling_rights['white']['K'], self.castling_rights['white']['Q'],
+             self.castling_rights['black']['K'], self.castling_rights['black']['Q']),
+            self.en_passant_square, self.half_move_clock, self.full_move_number,
+            self.white_king_pos, self.black_king_pos, self.game_result,
+            (self.white_attackers, self.black_attackers, self.white_defenders, self.black_defenders),
+            self.hash, self.pawn_hash, (self.material_score, self.positional_score)))
+        self.hash_history.append(self.hash)
+
+        # Update the hash for the pieces leaving their squares
+        piece_keys = zobrist.PIECE_KEYS
+        key = self.hash ^ zobrist.BLACK_TO_MOVE_KEY ^ zobrist.get_castling_hash(self.castling_rights)
+        key ^= piece_keys[piece.color][piece.type][start_index]
+        if captured_piece is not None:
+            key ^= piece_keys[captured_piece.color][captured_piece.type][util.SQUARE_INDICES[captured_square]]
+        if self.en_passant_square is not None:
+            key ^= zobrist.EN_PASSANT_KEYS[self.en_passant_square % 8]
+
+        # Make the move, promotions are handled by the board
+        promotion = move >> move_encoding.PROMOTION_SHIFT & move_encoding.PROMOTION_MASK
+        board.move_piece(start, end, move_encoding.PROMOTION_LETTERS[promotion])
+        moved_piece = board.squares[end_index]
+        key ^= piece_keys[moved_piece.color][moved_piece.type][end_index]
+        if rook_move is not None:
+            board.move_piece(rook_move[0], rook_move[1])
+            rook_keys = piece_keys[piece.color]['rook']
+            key ^= rook_keys[util.SQUARE_INDICES[rook_move[0]]] ^ rook_keys[util.SQUARE_INDICES[rook_move[1]]]
+
+        # Update the evaluation totals the same way, a promotion changes the material as well
+        square_scores = piece_square.PIECE_SQUARE_SCORES
+        positional_score = self.positional_score - square_scores[piece.color][piece.type][start_index] + \
+            square_scores[moved_piece.color][moved_piece.type][end_index]
+        if moved_piece.type != piece.type:
+            self.material_score += piece_square.get_material_value(moved_piece) - piece_square.get_material_value(piece)
+        if captured_piece is not None:
+            self.material_score -= piece_square.get_material_value(captured_piece)
+            positional_score -= square_scores[captured_piece.color][captured_piece.type][
+                util.SQUARE_INDICES[captured_square]]
+        if rook_move is not None:
+            rook_scores = square_scores[piece.color]['rook']
+            positional_score += rook_scores[util.SQUARE_INDICES[rook_move[1]]] - \
+                rook_scores[util.SQUARE_INDICES[rook_move[0]]]
+        self.positional_score = positional_score
+
+        # Update castling rights if a king or rook moves or a rook is captured
+        if piece.type == 'king':
+            self.castling_rights[piece.color]['K'] = False
+            self.castling_rights[piece.color]['Q'] = False
+        for square in (start, end):
+            if square in CASTLING_ROOK_SQUARES:
+                color, side = CASTLING_ROOK_SQUARES[square]
+                self.castling_rights[color][side] = False
+
+        # Remember the square a pawn skipped over if an enemy pawn could capture it en passant
+        self.en_passant_square = None
+        if move & move_encoding.DOUBLE_PUSH:
+            self.en_passant_square = self.get_en_passant_square(piece.color, start_index, end_index)
+            if self.en_passant_square is not None:
+                key ^= zobrist.EN_PASSANT_KEYS[self.en_passant_square % 8]
+        self.hash = key ^ zobrist.get_castling_hash(self.castling_rights)
+
+        # Only pawn moves, pawn captures and promotions change the pawn structure
+        if piece.type == 'pawn':
+            pawn_keys = piece_keys[piece.color]['pawn']
+            self.pawn_hash ^= pawn_keys[start_index]
+            if moved_piece.type == 'pawn':
+                self.pawn_hash ^= pawn_keys[end_index]
+        if captured_piece is not None and captured_piece.type == 'pawn':
+            self.pawn_hash ^= piece_keys[captured_piece.color]['pawn'][util.SQUARE_INDICES[captured_square]]
 
-        state.white_king_pos = state.board.get_king_position('white')
-        state.black_king_pos = state.board.get_king_position('black')
-        state.update_attackers('white')
-        state.update_attackers('black')
+        if piece.type == 'king':
+            if piece.color == 'white':
+                self.white_king_pos = piece.position
+            else:
+                self.black_king_pos = piece.position
 
         if captured_piece is not None or piece.type == 'pawn':
-            state.half_move_clock = 0
+            self.half_move_clock = 0
         else:
-            state.half_move_clock += 1
+            self.half_move_clock += 1
 
-        # Switch players
-        if state.current_player == 'white':
-            state.current_player = 'black'
-        else:
-            state.current_player = 'white'
+        # Cached attackers refer to the previous position
+        self.white_attackers = []
+        self.black_attackers = []
+        self.white_defenders = []
+        self.black_defenders = []
 
-        state.update_game_result()
+        self.move_history.append(move)
 
-        # Update the PGN
-        # print("Updating PGN")
-        # print("Piece was a", piece.type, "of color", piece.color)
-        # print("Move was", start, "to", end)
-        # print("Captured piece was", captured_piece)
-        # print("Current player is", state.current_player)
-        if state.current_player == 'black':
-            state.pgn += str(state.full_move_number) + '. '
-        if castling:
-            if end[0] == 'g':
-                state.pgn += 'O-O'
-            else:
-                state.pgn += 'O-O-O'
+        # Switch players and update the full move number
+        if self.current_player == 'white':
+            self.current_player = 'black'
         else:
-            if piece.type == 'pawn' and captured_piece is not None:
-                state.pgn += start[0]
-            elif piece.type == 'pawn' and captured_piece is None and end[0] != start[0]:
-                state.pgn += start[0]
-            elif piece.type != 'pawn':
-                state.pgn += piece.letter.upper()
-            if captured_piece is not None:
-                state.pgn += 'x'
-            state.pgn += end
-            if state.promotion:
-                state.pgn += '=Q'
-            if state.is_checkmate():
-                state.pgn += '#'
-            else:
-                if state.is_in_check(state.current_player):
-                    state.pgn += '+'
-
-        state.pgn += ' '
-
-        # Update the full move number
-        if state.current_player == 'white':
-            state.full_move_number += 1
+            self.current_player = 'white'
+            self.full_move_number += 1
 
-        # Update castling rights
-        if piece.type == 'king':
-            state.castling_rights[piece.color]['K'] = False
-            state.castling_rights[piece.color]['Q'] = False
-        elif piece.type == 'rook':
-            if piece.color == 'white':
-                if piece.position[0] == 0:
-                    state.castling_rights['white']['Q'] = False
-                elif piece.position[0] == 7:
-                    state.castling_rights['white']['K'] = False
-            else:
-                if piece.position[0] == 0:
-                    state.castling_rights['black']['Q'] = False
-                elif piece.position[0] == 7:
-                    state.castling_rights['black']['K'] = False
+    def push_null(self):
+        """Pass the turn to the opponent without moving a piece, as the null move pruning of the searches does.
+        The null move is taken back with pop() like any other move."""
+        self.undo_stack.append(UndoRecord(
+            move_encoding.NULL_MOVE, None, False, None, None, None, False,
+            (self.castling_rights['white']['K'], self.castling_rights['white']['Q'],
+             self.castling_rights['black']['K'], self.castling_rights['black']['Q']),
+            self.en_passant_square, self.half_move_clock, self.full_move_number,
+            self.white_king_pos, self.black_king_pos, self.game_result,
+            (self.white_attackers, self.black_attackers, self.white_defenders, self.black_defenders),
+            self.hash, self.pawn_hash, (self.material_score, self.positional_score)))
+        self.hash_history.append(self.hash)
+        self.hash ^= zobrist.BLACK_TO_MOVE_KEY
+        if self.en_passant_square is not None:
+            self.hash ^= zobrist.EN_PASSANT_KEYS[self.en_passant_square % 8]
+            self.en_passant_square = None
+        self.half_move_clock += 1
+        self.move_history.append(move_encoding.NULL_MOVE)
+        if self.current_player == 'white':
+            self.current_player = 'black'
+        else:
+            self.current_player = 'white'
+            self.full_move_number += 1
 
-        return state
+    def pop(self):
+        """Take back the last move made with push() or push_null() and return it"""
+        record = self.undo_stack.pop()
+        board = self.board
+        start, end = move_encoding.to_tuple(record.move)
+        piece = record.piece
+
+        # A null move did not move any piece
+        if piece is not None:
+            # Take back the rook move of a castling move
+            if record.rook_move is not None:
+                rook = board.get_piece_by_square(record.rook_move[1])
+                board.remove_piece(record.rook_move[1])
+                board.set_piece(record.rook_move[0], rook)
+                rook.move(record.rook_move[0])
+                rook.moved = record.rook_moved
+
+            # Put the moving piece back, this also undoes a promotion
+            board.remove_piece(end)
+            board.set_piece(start, piece)
+            piece.move(start)
+            piece.moved = record.moved
+            if record.captured_piece is not None:
+                board.set_piece(record.captured_square, record.captured_piece)
+
+        (self.castling_rights['white']['K'], self.castling_rights['white']['Q'],
+         self.castling_rights['black']['K'], self.castling_rights['black']['Q']) = record.castling_rights
+        self.en_passant_square = record.en_passant_square
+        self.half_move_clock = record.half_move_clock
+        self.full_move_number = record.full_move_number
+        self.white_king_pos = record.white_king_pos
+        self.black_king_pos = record.black_king_pos
+        self.game_result = record.game_result
+        self.white_attackers, self.black_attackers, self.white_defenders, self.black_defenders = record.attackers
+        self.hash = record.hash
+        self.pawn_hash = record.pawn_hash
+        self.material_score, self.positional_score = record.scores
+        self.hash_history.pop()
+        self.current_player = util.get_opponent_color(self.current_player)
+        self.move_history.pop()
+        return record.move
+
+    def get_en_passant_square(self, color, start_index, end_index):
+        """Return the board index a pawn of the given color skipped over with a double move,
+        or None if no enemy pawn stands next to it to capture en passant"""
+        for neighbour in (end_index - 1, end_index + 1):
+            if neighbour // 8 != end_index // 8:
+                continue
+            enemy = self.board.squares[neighbour]
+            if enemy is not None and enemy.type == 'pawn' and enemy.color != color:
+                return (start_index + end_index) // 2
+        return None
 
     def update_attackers(self, color):
-        # Update the list of possible attacker squares on the king of the given color
+        # Update the list of attacker squares on the king of the given color
+        # and the list of squares of the pieces defending those attackers
+        enemy = util.get_opponent_color(color)
         king_pos = self.white_king_pos if color == 'white' else self.black_king_pos
-        attackers = []
+        king_index = util.coordinates_to_index(king_pos[0], king_pos[1])
+        attackers = [util.SQUARE_NAMES[index] for index in self.board.get_attackers(king_index, enemy)]
         defenders = []
-        all_piece_positions = self.board.get_pieces_by_color(util.get_opponent_color(color))
-        for piece_pos in all_piece_positions:
-            if self.is_valid_move(piece_pos, util.coordinates_to_square(king_pos[0], king_pos[1])):
-                attackers.append(piece_pos)
-        for piece_pos in all_piece_positions:
-            for attacker in attackers:
-                piece = self.board.get_piece_by_square(piece_pos)
-                if util.square_to_coordinates(attacker) in piece.defending_pieces:
-                    defenders.append(piece_pos)
+        for attacker in attackers:
+            for index in self.board.get_attackers(attacker, enemy):
+                if util.SQUARE_NAMES[index] not in defenders:
+                    defenders.append(util.SQUARE_NAMES[index])
         if color == 'white':
             self.white_attackers = attackers
             self.black_defenders = defenders
@@ -326,7 +398,7 @@ class Game:
         return self.game_result
 
     def get_move_history(self):
-        return self.move_history
+        return [move_encoding.to_tuple(move) for move in self.move_history]
 
     def get_legal_moves(self, square):
         """Return a list of legal moves for the piece at the given square"""
@@ -336,41 +408,36 @@ class Game:
         return piece.get_legal_moves(self.board)
 
     def get_valid_moves(self):
-        """Return a list of all valid moves for the current player"""
-        valid_moves = []
-        for piece_pos in self.board.get_pieces_by_color(self.current_player):
-            piece = self.board.get_piece_by_square(piece_pos)
-            for move in piece.get_legal_moves(self.board):
-                move = util.coordinates_to_square(move[0], move[1])
-                if self.is_valid_move(piece.square, move):
-                    valid_moves.append((piece.square, move))
-        return valid_moves
+        """Return a list of all valid moves for the current player as (start, end) tuples.
+        Promotions are listed once, a pawn reaching the last rank promotes to a queen with make_move."""
+        return [move_encoding.to_tuple(move) for move in movegen.generate_legal_moves(self)
+                if move_encoding.get_promotion(move) in (None, 'queen')]
+
+    def generate_moves(self):
+        """Return a list of all valid moves for the current player encoded by the move_encoding module.
+        Searches should use these, they can be passed to push() directly."""
+        return movegen.generate_legal_moves(self)
+
+    def generate_captures(self):
+        """Return the valid captures and promotions for the current player encoded by the move_encoding module"""
+        tactical = move_encoding.CAPTURE | move_encoding.PROMOTION_MASK << move_encoding.PROMOTION_SHIFT
+        return [move for move in movegen.generate_legal_moves(self) if move & tactical]
 
     def get_valid_moves_for_piece(self, square):
-        piece = self.board.get_piece_by_square(square)
-        valid_moves = []
-        for move in piece.get_legal_moves(self.board):
-            move = util.coordinates_to_square(move[0], move[1])
-            if self.is_valid_move(piece.square, move):
-                valid_moves.append(move)
-        return valid_moves
+        """Return a list of the squares the piece at the given square can legally move to"""
+        return [util.SQUARE_NAMES[move_encoding.get_end(move)]
+                for move in movegen.generate_legal_moves(self, util.square_to_index(square))
+                if move_encoding.get_promotion(move) in (None, 'queen')]
 
     def is_in_check(self, color):
         """Return True if the given color is in check, False otherwise"""
         king_pos = self.white_king_pos if color == 'white' else self.black_king_pos
-        attackers = self.white_attackers if color == 'white' else self.black_attackers
-        for attacker in attackers:
-            piece = self.board.get_piece_by_square(attacker)
-            for move in piece.get_legal_moves(self.board):
-                if move == king_pos:
-                    return True
-        pieces = self.board.get_pieces_by_color(util.get_opponent_color(color))
-        for piece in pieces:
-            piece = self.board.get_piece_by_square(piece)
-            legal_moves = piece.get_legal_moves(self.board)
-            if king_pos in legal_moves:
-                return True
-        return False
+        return self.board.is_attacked(king_pos[1] * 8 + king_pos[0], util.get_opponent_color(color))
+
+    def is_attacked(self, square, by_color):
+        """Return True if the given square (a board index or an algebraic square) is attacked
+        by any piece of the given color"""
+        return self.board.is_attacked(square, by_color)
 
     def is_valid_move(self, start, end):
         """Return True if the given move is valid, False otherwise"""
@@ -380,248 +447,70 @@ class Game:
         if piece is None or piece.color != self.current_player:
             return False
 
-        # Check if the piece can move to the given square
-        legal_moves = piece.get_legal_moves(self.board)
-        if util.square_to_coordinates(end) not in legal_moves:
-            return False
-
-        # If the move is en passant, check if the captured pawn moved two squares on the last move
-        if piece.type == 'pawn' and end[0] != start[0] and self.board.get_piece_by_square(end) is None:
-            # print("En passant move: ", start, end)
-            last_move = self.move_history[len(self.move_history) - 1]
-            # print("Last move: ", last_move)
-            last_move = (util.square_to_coordinates(last_move[0]), util.square_to_coordinates(last_move[1]))
-            end_move_coords = util.square_to_coordinates(end)
-            if self.current_player == 'white':
-                if last_move[1][1] != end_move_coords[1] + 1 or last_move[1][0] != end_move_coords[0]:
-                    return False
-            else:
-                if last_move[1][1] != end_move_coords[1] - 1 or last_move[1][0] != end_move_coords[0]:
-                    return False
-
-        # Check if the checking piece is defended
-        defenders = self.white_defenders if self.current_player == 'black' else self.black_defenders
-        for defender in defenders:
-            piece = self.board.get_piece_by_square(defender)
-            if util.square_to_coordinates(end) in piece.defending_pieces:
-                if self.board.get_piece_by_square(start).type == 'king':
-                    return False
-
-        # Make the move on a copy of the board to avoid altering the actual board
-        game_copy = copy.deepcopy(self)
-
-        # If the move is a castling move
-        if piece.type == 'king' and abs(ord(start[0]) - ord(end[0])) == 2:
-            if self.current_player == 'white':
-                if self.board.get_piece_by_square('e1') is None:
-                    return False
-            else:
-                if self.board.get_piece_by_square('e8') is None:
-                    return False
-
-            # print("Checking legality of castling move:", start, "to", end)
-            # Can not castle while in check
-            if self.is_in_check(self.current_player):
-                return False
-
-            # Can not castle if the king or rook has moved
-            if self.current_player == 'white':
-                if end == 'g1':
-                    if self.board.get_piece_by_square('h1').type != 'rook' and \
-                            self.board.get_piece_by_square('h1').color != 'white':
-                        return False
-                    else:
-                        if not self.castling_rights['white']['K']:
-                            return False
-                else:
-                    if self.board.get_piece_by_square('a1').type != 'rook' and \
-                            self.board.get_piece_by_square('a1').color != 'white':
-                        return False
-                    else:
-                        if not self.castling_rights['white']['Q']:
-                            return False
-            else:
-                if end == 'g8':
-                    if self.board.get_piece_by_square('h8').type != 'rook' and \
-                            self.board.get_piece_by_square('h8').color != 'black':
-                        return False
-                    else:
-                        if not self.castling_rights['black']['K']:
-                            return False
-                else:
-                    if self.board.get_piece_by_square('a8').type != 'rook' and \
-                            self.board.get_piece_by_square('a8').color != 'black':
-                        return False
-                    else:
-                        if not self.castling_rights['black']['Q']:
-                            return False
-
-            king_piece = game_copy.board.get_piece_by_square(start)
-            if king_piece.color == 'white':
-                if end == 'g1':
-                    rook_piece = game_copy.board.get_piece_by_square('h1')
-                else:
-                    rook_piece = game_copy.board.get_piece_by_square('a1')
-            else:
-                if end == 'g8':
-                    rook_piece = game_copy.board.get_piece_by_square('h8')
-                else:
-                    rook_piece = game_copy.board.get_piece_by_square('a8')
-
-            # print("Rook to move:", rook_piece.square)
-
-            if rook_piece.square[0] == 'h':
-                if rook_piece.square[1] == '1':
-                    game_copy.board.move_piece('e1', 'f1')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-                    game_copy.board.move_piece('f1', 'g1')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-                else:
-                    game_copy.board.move_piece('e8', 'f8')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-                    game_copy.board.move_piece('f8', 'g8')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-            else:
-                if rook_piece.square[1] == 1:
-                    game_copy.board.move_piece('e1', 'd1')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-                    game_copy.board.move_piece('d1', 'c1')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-                else:
-                    game_copy.board.move_piece('e8', 'd8')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-                    game_copy.board.move_piece('d8', 'c8')
-                    if game_copy.is_in_check(game_copy.current_player):
-                        return False
-
-            if game_copy.is_in_check(game_copy.current_player):
-                return False
-            return True
-        else:
-            piece = game_copy.board.get_piece_by_square(start)
-            game_copy.board.move_piece(start, end)
-
-            # Check if the move would put a king next to another king
-            if piece.type == 'king':
-                target_square = util.square_to_coordinates(end)
-                for i in range(2):
-                    for j in range(2):
-                        try:
-                            adj_piece = game_copy.board.get_piece_by_coordinates(
-                                target_square[0] + i, target_square[1] + j)
-                        except KeyError:
-                            continue
-                        if adj_piece is not None:
-                            if adj_piece.type == 'king' and adj_piece.color != piece.color:
-                                return False
-                        try:
-                            adj_piece = game_copy.board.get_piece_by_coordinates(
-                                target_square[0] + i, target_square[1] - j)
-                        except KeyError:
-                            continue
-                        if adj_piece is not None:
-                            if adj_piece.type == 'king' and adj_piece.color != piece.color:
-                                return False
-                        try:
-                            adj_piece = game_copy.board.get_piece_by_coordinates(
-                                target_square[0] - i, target_square[1] + j)
-                        except KeyError:
-                            continue
-                        if adj_piece is not None:
-                            if adj_piece.type == 'king' and adj_piece.color != piece.color:
-                                return False
-                        try:
-                            adj_piece = game_copy.board.get_piece_by_coordinates(
-                                target_square[0] - i, target_square[1] - j)
-                        except KeyError:
-                            continue
-                        if adj_piece is not None:
-                            if adj_piece.type == 'king' and adj_piece.color != piece.color:
-                                return False
-                if piece.color == 'white':
-                    game_copy.white_king_pos = util.square_to_coordinates(end)
-                else:
-                    game_copy.black_king_pos = util.square_to_coordinates(end)
-
-            # Check if the move would put the player in check
-            return not game_copy.is_in_check(piece.color)
+        end_index = util.square_to_index(end)
+        return any(move_encoding.get_end(move) == end_index
+                   for move in movegen.generate_legal_moves(self, piece.index))
 
     def is_checkmate(self):
-        if self.is_in_check(self.current_player):
-            for square in self.board.get_pieces_by_color(self.current_player):
-                for move in self.get_legal_moves(square):
-                    if self.is_valid_move(square, util.coordinates_to_square(move[0], move[1])):
-                        return False
+        if self.is_in_check(self.current_player) and not self.get_valid_moves():
+            # The player to move has been checkmated
             if self.current_player == 'white':
-                self.game_result = '1-0'
-            else:
                 self.game_result = '0-1'
+            else:
+                self.game_result = '1-0'
             return True
         return False
 
     def is_stalemate(self):
-        if not self.is_in_check(self.current_player):
-            for square in self.board.get_pieces_by_color(self.current_player):
-                piece = self.board.get_piece_by_square(square)
-                for move in piece.get_legal_moves(self.board):
-                    if self.is_valid_move(square, util.coordinates_to_square(move[0], move[1])):
-                        return False
+        if not self.is_in_check(self.current_player) and not self.get_valid_moves():
             self.game_result = 'stalemate'
             return True
         return False
 
     def is_insufficient_material(self):
         """Returns True if the game is a draw due to insufficient material, False otherwise"""
-        # Check if there are any pawns, rooks, or queens
-        if self.board.get_pieces_by_type('pawn') == [] and \
-                self.board.get_pieces_by_type('rook') == [] and \
-                self.board.get_pieces_by_type('queen') == []:
-            # Check if there are any knights or bishops
-            if self.board.get_pieces_by_type_and_color('knight', 'white') == [] and \
-                    self.board.get_pieces_by_type_and_color('knight', 'black') == [] and \
-                    self.board.get_pieces_by_type_and_color('bishop', 'white') == [] and \
-                    self.board.get_pieces_by_type_and_color('bishop', 'black') == []:
-                self.game_result = 'draw'
-                print('Draw due to insufficient material')
-                return True
-            # Check if there is only one knight or bishop
-            elif len(self.board.get_pieces_by_type('knight')) == 1 and self.board.get_pieces_by_type('bishop') == []:
-                self.game_result = 'draw'
-                print('Draw due to insufficient material')
-                return True
-            # Check if there are two bishops of different colors
-            elif len(self.board.get_pieces_by_type('bishop')) == 1 and self.board.get_pieces_by_type('knight') == []:
-                self.game_result = 'draw'
-                print('Draw due to insufficient material')
-                return True
-            elif len(self.board.get_pieces_by_type('bishop')) == 2:
-                bishop1 = self.board.get_piece_by_square(self.board.get_pieces_by_type('bishop')[0])
-                bishop2 = self.board.get_piece_by_square(self.board.get_pieces_by_type('bishop')[1])
-                if (bishop1.color == 'white' and bishop2.color == 'black') or \
-                        (bishop1.color == 'black' and bishop2.color == 'white'):
-                    self.game_result = 'draw'
-                    print('Draw due to insufficient material')
-                    return True
+        if self.has_insufficient_material():
+            self.game_result = 'draw'
+            print('Draw due to insufficient material')
+            return True
         return False
 
+    def has_insufficient_material(self):
+        """Return True if neither player has the material to checkmate: only kings and at most one knight or bishop,
+        or one bishop each. Unlike is_insufficient_material nothing is printed or stored."""
+        pieces = {color: {piece_type: len(indices) for piece_type, indices in piece_indices.items()}
+                  for color, piece_indices in self.board.piece_squares.items()}
+        if any(pieces[color][piece_type] for color in pieces for piece_type in ('pawn', 'rook', 'queen')):
+            return False
+        knights = pieces['white']['knight'] + pieces['black']['knight']
+        bishops = pieces['white']['bishop'], pieces['black']['bishop']
+        if knights + sum(bishops) <= 1:
+            return True
+        return knights == 0 and bishops == (1, 1)
+
     def is_threefold_repetition(self):
         """Returns True if the game is a draw due to threefold repetition, False otherwise"""
-        threefold = self.fen_history.count(self.board.get_fen()) >= 3
+        threefold = self.count_repetitions() >= 2
         if threefold:
             print('Threefold repetition')
             self.game_result = 'draw'
         return threefold
 
+    def count_repetitions(self):
+        """Return how often the current position occurred before"""
+        # Positions from before the last capture or pawn move can not repeat
+        return self.hash_history[max(0, len(self.hash_history) - self.half_move_clock):].count(self.hash)
+
+    def is_draw(self):
+        """Return True if the position is drawn by the fifty move rule or insufficient material, or repeats
+        an earlier position. Nothing is printed or stored, so the searches can call it at every node:
+        a single repetition is enough there, repeating it again can not be better for either player."""
+        return self.half_move_clock >= FIFTY_MOVE_PLIES or self.count_repetitions() >= 1 or \
+            self.has_insufficient_material()
+
     def is_fifty_move_rule(self):
         """Returns True if the game is a draw due to the fifty move rule, False otherwise"""
-        fifty_moves = self.half_move_clock >= 50
+        fifty_moves = self.half_move_clock >= FIFTY_MOVE_PLIES
         if fifty_moves:
             print('Fifty move rule')
             self.game_result = 'draw'
@@ -642,19 +531,16 @@ class Game:
 
     def get_last_move(self):
         """Returns the last move in the game"""
-        return self.move_history[-1]
+        return move_encoding.to_tuple(self.move_history[-1])
 
     def get_first_move(self):
         """Returns the first move in the game"""
-        return self.move_history[0]
+        return move_encoding.to_tuple(self.move_history[0])
 
     def get_move_by_number(self, move_number):
         """Returns the move at the given move number"""
-        return self.move_history[move_number]
+        return move_encoding.to_tuple(self.move_history[move_number])
 
     def is_capture(self, move):
-        """Returns True if the given move is a capture, False otherwise"""
-        end = move[1]
-        if self.board.get_piece_by_square(end) is not None:
-            return True
-        return False
+        """Returns True if the given encoded move is a capture, False otherwise"""
+        return move_encoding.is_capture(move)
@@ -4,6 +4,7 @@
 import pygame
 import pygame.freetype
 import util
+import move_encoding
 # from mcts import Tree
 from minimax import Minimax
 import amsel_engine
@@ -22,6 +23,9 @@ class PygameGUI:
         self.cell_size = 80
         self.game = game
         self.engine = amsel_engine.Engine()
+        # The search is kept between moves so its worker processes and hash table are reused
+        self.minimax = Minimax(10, 6)
+        self.ENGINE_MOVETIME = 5000
         self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
         self.label_font = pygame.freetype.Font('./assets/fonts/Roboto-Bold.ttf', 16)
         self.annotation_font = pygame.freetype.Font('./assets/fonts/Roboto-Regular.ttf', 16)
@@ -105,9 +109,9 @@ class PygameGUI:
 
     def make_engine_move(self):
         """Makes the engine's best move."""
-        mm = Minimax(10, 6)
-        best_move = mm.find_best_move(self.game)
-        self.game.make_move(best_move[0], best_move[1])
+        best_move = self.minimax.search(self.game, movetime=self.ENGINE_MOVETIME)
+        start, end = move_encoding.to_tuple(best_move)
+        self.game.make_move(start, end, move_encoding.get_promotion(best_move))
 
     def toggle_square_color(self):
         if self.light_square_color == (255, 206, 158):
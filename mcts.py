@@ -1,26 +1,29 @@
 import random
 import math
-import copy
 import multiprocessing as mp
+import threading
+import time
 import numpy as np
 
 import amsel_engine
+import util
+from minimax import Line
 
 
 class Node:
-    def __init__(self, state, parent=None):
-        self.state = state
+    def __init__(self, player, parent=None):
+        self.player = player  # The player to move in the position of this node
         self.parent = parent
         self.children = []
         self.num_visits = 0
         self.total_score = 0
         self.move = None
 
-    def is_fully_expanded(self):
-        return len(self.children) == len(self.state.get_valid_moves())
+    def is_fully_expanded(self, state):
+        return len(self.children) == len(state.generate_moves())
 
-    def add_child(self, child_state):
-        child_node = Node(child_state, self)
+    def add_child(self):
+        child_node = Node(util.get_opponent_color(self.player), self)
         self.children.append(child_node)
         return child_node
 
@@ -37,14 +40,12 @@ class Node:
         self.total_score += score
 
 
-def expand(node):
+def expand(node, state):
     # print('Expanding node')
-    valid_moves = node.state.get_valid_moves()
+    valid_moves = state.generate_moves()
     random.shuffle(valid_moves)
     for move in valid_moves:
-        child_state = copy.deepcopy(node.state)
-        child_state.make_move(move[0], move[1])
-        child_node = node.add_child(child_state)
+        child_node = node.add_child()
         child_node.move = move
         # print('Added child with move', move)
     return node
@@ -52,11 +53,11 @@ def expand(node):
 
 def backpropagation(node, score):
     while node is not None:
-        if node.state.current_player == 'black':
+        if node.player == 'black':
             node.update(-score)
         else:
             node.update(score)
-        # print('Updated node with moves', node.state.move_history, 'with score', score)
+        # print('Updated node with player', node.player, 'with score', score)
         node = node.parent
 
 
@@ -65,9 +66,16 @@ class Tree:
     MAX_SIMULATIONS = 50
 
     def __init__(self, state):
+        # The tree is walked by making and taking back moves on this single state
+        self.state = state
         self.num_simulations = 0
-        self.root = Node(state)
+        self.root = Node(state.current_player)
         self.engine = amsel_engine.Engine()
+        self.stop_event = threading.Event()  # Set by stop() from another thread
+
+    def stop(self):
+        """Stop find_best_move after the running simulation, it then returns the best move found so far"""
+        self.stop_event.set()
 
     def select(self, node):
         print('Selecting node')
@@ -85,50 +93,62 @@ class Tree:
                     # print('Selected child:', selected_child.move)
         return self.select(selected_child)
 
-    def simulation(self, node):
+    def simulation(self, state):
         print('')
-        state = copy.deepcopy(node.state)
         depth = 0
-        while not state.is_game_over() and depth < self.MAX_DEPTH:
-            move = random.choice(state.get_valid_moves())
+        valid_moves = state.generate_moves()
+        while valid_moves and depth < self.MAX_DEPTH:
+            move = random.choice(valid_moves)
             # print('Randomly selected move:', move)
-            state.make_move(move[0], move[1])
+            state.push(move)
             depth += 1
-        if state.is_game_over():
-            if state.is_checkmate():
-                if state.game_result == '1-0':
-                    return 1
-                else:
-                    return 0
+            valid_moves = state.generate_moves()
+        if not valid_moves:
+            if state.is_in_check(state.current_player):
+                # The player to move is checkmated
+                evaluation = 1 if state.current_player == 'black' else 0
             else:
                 # print('returning 0.5')
-                return 0.5
-        evaluation = self.engine.evaluate_position(state) / 100
-        # print('returning', evaluation, 'after moves', state.move_history)
+                evaluation = 0.5
+        else:
+            evaluation = self.engine.evaluate_position(state) / 100
+            # print('returning', evaluation, 'after moves', state.move_history)
+        for _ in range(depth):
+            state.pop()
         return evaluation
 
-    def find_best_move(self):
+    def find_best_move(self, movetime=None, nodes=None):
+        """Return the most visited root move after nodes simulations (MAX_SIMULATIONS by default),
+        after movetime milliseconds or when stop() is called, whichever comes first"""
         print('')
-        for _ in range(self.MAX_SIMULATIONS):
+        self.stop_event.clear()
+        stop_time = time.time() + movetime / 1000 if movetime is not None else None
+        for _ in range(nodes if nodes is not None else self.MAX_SIMULATIONS):
+            if self.stop_event.is_set() or (stop_time is not None and time.time() >= stop_time):
+                break
             # printout = 'Running random simulation at depth ' + str(depth + 1)
             # print(printout, end='\r')
             printout = 'Running simulation ' + str(_ + 1)
             print(printout, end='\r')
             node = self.root
-            state = copy.deepcopy(node.state)
+            depth = 0
 
-            while not node.is_fully_expanded() and node.children:
+            while not node.is_fully_expanded(self.state) and node.children:
                 # print('Selecting child node')
                 node = node.select_child()
-                state.make_move(node.move[0], node.move[1])
+                self.state.push(node.move)
+                depth += 1
 
-            if not node.is_fully_expanded():
+            if not node.is_fully_expanded(self.state):
                 # print('simulating not fully expanded node')
-                expand(node)
-                score = self.simulation(node)
+                expand(node, self.state)
+                score = self.simulation(self.state)
             else:
                 # print('simulating fully expanded node')
-                score = self.simulation(node)
+                score = self.simulation(self.state)
+
+            for _ in range(depth):
+                self.state.pop()
 
             while node is not None:
                 backpropagation(node, score)
@@ -143,4 +163,23 @@ class Tree:
                 max_visits = child.num_visits
                 best_node = child
 
-        return best_node.move
\ No newline at end of file
+        # Stopped before the root was expanded
+        if best_node is None:
+            return None
+        return best_node.move
+
+    def get_best_lines(self, num_lines):
+        """Return the num_lines most visited root moves as Lines, most visited first.
+        The score is the mean simulation result for the player to move, the principal variation
+        follows the most visited child down the tree and its length is the depth."""
+        lines = []
+        children = sorted((c for c in self.root.children if c.num_visits), key=lambda c: c.num_visits, reverse=True)
+        for child in children[:num_lines]:
+            pv = []
+            node = child
+            while node is not None and node.num_visits:
+                pv.append(node.move)
+                node = max(node.children, key=lambda c: c.num_visits, default=None)
+            # The scores of a node are kept for the player to move after it, the opponent of the root player
+            lines.append(Line(child.move, -child.total_score / child.num_visits, len(pv), pv))
+        return lines
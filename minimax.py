@@ -1,9 +1,75 @@
 import concurrent.futures
+import copy
+from collections import namedtuple
+import math
+import multiprocessing as mp
 import threading
+import time
 from amsel_engine import Engine
+import transposition
+from transposition import TranspositionTable
 from dataclasses import dataclass
-import util
-import random
+from ordering import MoveOrderer, TACTICAL_MOVE, get_capture_gain, order_captures
+from search_stats import SearchStats
+
+# Score of a checkmate, matching the evaluation of a finished game in Engine.evaluate_position
+MATE_SCORE = 1000000
+# A capture is skipped in the quiescence search if winning the captured piece plus this margin (in pawns)
+# can not bring the score above alpha
+DELTA_MARGIN = 2
+# How many plies shallower the position after a null move is searched
+NULL_MOVE_REDUCTION = 2
+# Width of the zero window used when only whether a score reaches a bound matters, in pawns
+NULL_WINDOW = 0.001
+# Quiet moves at the last ply are pruned if the static evaluation is this many pawns below alpha
+FUTILITY_MARGIN = 2
+# Nodes this many pawns below alpha, by remaining depth, are dropped into the quiescence search
+RAZORING_MARGINS = (0, 3, 5)
+# The processes of a parallel search claim the nodes they search from the shared node count in batches of this size
+NODE_BATCH = 256
+
+
+def get_late_move_reduction(depth, index):
+    """Return how many plies shallower the quiet move at the given index of the ordered moves is searched.
+    Moves late in the ordering rarely turn out best, the deeper the search the more they are reduced."""
+    if depth < 3 or index < 3:
+        return 0
+    return min(depth - 2, int(0.5 + math.log(depth) * math.log(index) / 2))
+
+
+def quiescence(searcher, state, alpha, beta):
+    """Search captures and promotions until the position is quiet, then evaluate it with the engine of the searcher.
+    Scores are from the point of view of the player to move. Shared by Minimax and Negamax, the searcher
+    counts the nodes in its statistics and check_limits of the searcher may abort the search."""
+    searcher.check_limits()
+    stats = searcher.stats.current
+    stats.quiescence_nodes += 1
+    in_check = state.is_in_check(state.current_player)
+    if in_check:
+        # Every evasion has to be searched, standing pat is not an option in check
+        moves = state.generate_moves()
+        if not moves:
+            return -MATE_SCORE
+        stand_pat = float('-inf')
+    else:
+        stats.eval_calls += 1
+        stand_pat = searcher.engine.evaluate_for_maximizing_player(state)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        moves = order_captures(state, state.generate_captures())
+
+    for move in moves:
+        # Delta pruning: skip captures that can not raise alpha even when winning the piece for free
+        if not in_check and stand_pat + get_capture_gain(state, move) + DELTA_MARGIN <= alpha:
+            continue
+        state.push(move)
+        score = -quiescence(searcher, state, -beta, -alpha)
+        state.pop()
+        if score >= beta:
+            return score
+        alpha = max(alpha, score)
+    return alpha
 
 
 @dataclass
@@ -13,99 +79,556 @@ class MinMaxValues:
         self.beta: float = float('inf')
 
 
-def order_moves(state):
-    legal_moves = state.get_valid_moves()
-    random.shuffle(legal_moves)
-    if len(legal_moves) <= 1:
-        return legal_moves
-    else:
-        ordered_moves = []
-        # First, order by captures
-        for move in legal_moves:
-            if state.is_capture(move):
-                ordered_moves.append(move)
-        # Then, order by check
-        for move in legal_moves:
-            new_state = state.apply_move(move[0], move[1])
-            if new_state.is_in_check(new_state.current_player):
-                if move not in ordered_moves:
-                    ordered_moves.append(move)
-        # Finally, order by threat
-        for move in legal_moves:
-            new_state = state.apply_move(move[0], move[1])
-            if new_state.is_checkmate():
-                ordered_moves.append(move)
-            elif new_state.is_in_check(new_state.current_player):
-                continue
-            else:
-                piece = state.board.get_piece_by_square(move[0])
-                threatened_squares = piece.get_legal_moves(state.board)
-                for threatened_pos in threatened_squares:
-                    threatened_square = util.coordinates_to_square(threatened_pos[0], threatened_pos[1])
-                    threatened_piece = new_state.board.get_piece_by_square(threatened_square)
-                    if threatened_piece is not None and threatened_piece.color != piece.color:
-                        if move not in ordered_moves:
-                            ordered_moves.append(move)
-                            break
-        # Finally, add any remaining legal moves that haven't been added yet
-        for move in legal_moves:
-            if move not in ordered_moves:
-                ordered_moves.append(move)
-        return ordered_moves
+class SharedBounds:
+    """Search bounds whose alpha lives in shared memory, so the processes of a parallel search
+    can cut off moves with the best score found by any of them"""
+    def __init__(self, shared_alpha):
+        self.shared_alpha = shared_alpha
+        self.beta = float('inf')
+
+    @property
+    def alpha(self):
+        return self.shared_alpha.value
+
+    @alpha.setter
+    def alpha(self, value):
+        self.shared_alpha.value = value
+
+
+# One line of a multi-PV search: a root move, its score for the player to move, the depth it was searched to
+# and its principal variation starting with the move
+Line = namedtuple('Line', ['move', 'score', 'depth', 'pv'])
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when its time or node limit is reached"""
+    pass
+
+
+# The searcher of a worker process of the parallel search, set up once when the process starts
+_worker = None
+
+
+def _init_worker(max_depth, hash_size, shared_alpha, stop_flag, shared_nodes, selectivity):
+    global _worker
+    _worker = Minimax(max_depth, 1, hash_size, None, *selectivity)
+    _worker.bounds = SharedBounds(shared_alpha)
+    _worker.lock = shared_alpha.get_lock()
+    _worker.stop_flag = stop_flag
+    _worker.shared_nodes = shared_nodes
+
+
+def _search_root_move(state, move, depth, stop_time, node_limit, previous_pv):
+    """Search one root move in a worker process, trying the moves of its principal variation from the previous
+    iteration first. Return its score, whether the score is exact rather than an upper bound,
+    its principal variation and the statistics of the search."""
+    _worker.nodes = 0
+    _worker.claimed_nodes = 0
+    _worker.stop_time = stop_time
+    _worker.node_limit = node_limit
+    _worker.stopped = False
+    # The worker lives as long as the pool, so its statistics and killer moves must not pile up over the tasks
+    _worker.stats = SearchStats()
+    _worker.orderer.reset_killers(state)
+    _worker.stats.start_depth(depth)
+    _worker.seed_pv(state, previous_pv)
+    try:
+        [(value, _, exact)] = _worker.search_root_moves(state, [move], depth, _worker.bounds)
+    finally:
+        _worker.release_nodes()
+    state.push(move)
+    pv = [move] + _worker.get_pv(state, depth - 1)
+    state.pop()
+    return value, exact, pv, _worker.stats.current
 
 
 class Minimax:
-    def __init__(self, max_depth, threads):
+    def __init__(self, max_depth, threads, hash_size=16, stats_output=None,
+                 null_move=True, late_move_reductions=True, futility_pruning=True, razoring=True):
         self.engine = Engine()
         self.max_depth = max_depth
         self.threads = threads
         self.lock = threading.Lock()
+        # Kept between searches. hash_size is the memory size in MB of the tables of all processes together,
+        # a parallel search gives every worker process a table of its own
+        self.hash_size = hash_size / (threads + 1) if threads > 1 else hash_size
+        self.table = TranspositionTable(self.hash_size)
+        self.orderer = MoveOrderer()
+        # The selective search features, each can be turned off to measure its effect
+        self.null_move = null_move
+        self.late_move_reductions = late_move_reductions
+        self.futility_pruning = futility_pruning
+        self.razoring = razoring
+        # Limits of the running search, set by search()
+        self.nodes = 0
+        self.node_limit = None
+        self.stop_time = None
+        self.depth_limit = max_depth
+        self.stopped = False
+        self.stop_flag = None  # Shared with the other processes of a parallel search
+        self.shared_nodes = None  # The nodes searched by all processes of a parallel search, set in the workers
+        self.claimed_nodes = 0  # The nodes a worker took from shared_nodes, searched or not
+        self.stop_event = threading.Event()  # Set by stop() from another thread
+        # Pondering searches the position after the expected reply on a background thread
+        self.ponder_thread = None
+        self.ponder_hash = None  # The hash of the position being pondered
+        self.ponder_result = None  # The best move of the ponder search, once it is done
+        self.pv = []  # The principal variation of the last completed iteration
+        # Statistics of the last search, written as JSON lines to stats_output if it is given
+        self.stats_output = stats_output
+        self.stats = SearchStats()
+        # With more than one thread the root moves are searched by a pool of processes,
+        # started on the first search and kept until close() is called
+        self.pool = None
+        self.shared_alpha = None
+        self.pool_nodes = None
+        # The principal variations of the root moves in the last iteration of a parallel search, by root move
+        self.root_pvs = {}
+
+    def get_pool(self):
+        """Return the process pool of the parallel search, starting it if needed"""
+        if self.pool is None:
+            self.shared_alpha = mp.Value('d', float('-inf'))
+            self.stop_flag = mp.RawValue('b', 0)
+            self.pool_nodes = mp.Value('q', 0)
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.threads, initializer=_init_worker,
+                initargs=(self.max_depth, self.hash_size, self.shared_alpha, self.stop_flag, self.pool_nodes,
+                          (self.null_move, self.late_move_reductions, self.futility_pruning, self.razoring)))
+        return self.pool
+
+    def close(self):
+        """Shut down the process pool of the parallel search"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def check_limits(self):
+        """Count a node, or abort the search before it if its time or node limit is reached"""
+        if self.shared_nodes is not None and self.nodes == self.claimed_nodes:
+            self.claim_nodes()
+        if self.stopped or self.stop_event.is_set() or (self.stop_flag is not None and self.stop_flag.value) or \
+                (self.node_limit is not None and self.nodes >= self.node_limit) or \
+                (self.stop_time is not None and time.time() >= self.stop_time):
+            self.stopped = True
+            if self.stop_flag is not None:
+                self.stop_flag.value = 1
+            raise SearchAborted()
+        self.nodes += 1
+
+    def claim_nodes(self):
+        """Take the next batch of nodes to search from the shared node count of a parallel search,
+        so the node limit holds for all processes together. Stop if the limit leaves none."""
+        with self.shared_nodes.get_lock():
+            batch = NODE_BATCH
+            if self.node_limit is not None:
+                batch = min(batch, self.node_limit - self.shared_nodes.value)
+            if batch <= 0:
+                self.stopped = True
+                return
+            self.shared_nodes.value += batch
+            self.claimed_nodes += batch
+
+    def release_nodes(self):
+        """Give the claimed nodes that were not searched back to the shared node count"""
+        with self.shared_nodes.get_lock():
+            self.shared_nodes.value -= self.claimed_nodes - self.nodes
+        self.claimed_nodes = self.nodes
+
+    def alphabeta(self, state, depth, alpha, beta, maximizing_player, allow_null=True):
+        """Search the given state to the given depth, making and taking back moves on it in place.
+        Scores are from the point of view of the maximizing player.
+        allow_null is False right after a null move, two null moves in a row would search nothing."""
+        self.check_limits()
+        stats = self.stats.current
+        stats.nodes += 1
+        # Never called for the root, so a repetition, the fifty move rule or bare kings are a draw here
+        if state.is_draw():
+            return 0, None
+        if state.is_game_over():
+            stats.eval_calls += 1
+            value = self.engine.evaluate_for_maximizing_player(state)
+            return (value if maximizing_player else -value), None
+        if depth == 0:
+            # Resolve captures before evaluating, the quiescence search scores for the player to move
+            if maximizing_player:
+                return self.quiescence(state, alpha, beta), None
+            return -self.quiescence(state, -beta, -alpha), None
 
-    def alphabeta(self, state, depth, alpha, beta, maximizing_player):
-        if depth == 0 or state.is_game_over():
-            return self.engine.evaluate_for_maximizing_player(state), None
+        # The table stores scores from the point of view of the player to move
+        key = state.hash
+        sign = 1 if maximizing_player else -1
+        low, high = (alpha, beta) if maximizing_player else (-beta, -alpha)
+        entry = self.table.probe(key)
+        stats.tt_probes += 1
+        if entry is not None:
+            stats.tt_hits += 1
+        score = transposition.get_cutoff(entry, depth, low, high)
+        if score is not None:
+            return sign * score, entry.move
 
+        moves = self.orderer.order_moves(state, state.generate_moves(), entry.move if entry is not None else None)
+        in_check = state.is_in_check(state.current_player)
+        if not moves:
+            # Checkmate or stalemate, prefer the quickest mate
+            if not in_check:
+                return 0, None
+            value = MATE_SCORE + depth
+            return (-value if maximizing_player else value), None
+
+        static_eval = None
+        if not in_check and (self.null_move or self.futility_pruning or self.razoring):
+            stats.eval_calls += 1
+            static_eval = self.engine.evaluate_for_maximizing_player(state)
+
+        # Razoring: a position far below alpha near the leaves is only checked for tactics
+        if self.razoring and static_eval is not None and depth < len(RAZORING_MARGINS) and \
+                static_eval + RAZORING_MARGINS[depth] <= low:
+            score = self.quiescence(state, low, high)
+            if score <= low:
+                return sign * score, None
+
+        # Null move pruning: if passing still beats beta, a real move will too, except in zugzwang,
+        # which is common enough in the endgame that a cutoff is verified there by a reduced search
+        if self.null_move and allow_null and static_eval is not None and static_eval >= high and \
+                depth > NULL_MOVE_REDUCTION:
+            # Only whether the score reaches beta (or alpha for the minimizing player) matters, so a zero window does
+            null_alpha, null_beta = (beta - NULL_WINDOW, beta) if maximizing_player else (alpha, alpha + NULL_WINDOW)
+            state.push_null()
+            result, _ = self.alphabeta(state, depth - 1 - NULL_MOVE_REDUCTION, null_alpha, null_beta,
+                                       not maximizing_player, False)
+            state.pop()
+            if sign * result >= high and state.board.is_endgame():
+                result, _ = self.alphabeta(state, depth - NULL_MOVE_REDUCTION, null_alpha, null_beta,
+                                           maximizing_player, False)
+            if sign * result >= high:
+                return sign * high, None
+
+        # Futility pruning: at the last ply, quiet moves can not bring a position far below alpha back up
+        futile = self.futility_pruning and static_eval is not None and depth == 1 and \
+            static_eval + FUTILITY_MARGIN <= low
+
+        best_move = None
         if maximizing_player:
             value = float('-inf')
-            best_move = None
-            futures = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
-                for move in order_moves(state):
-                    child_state = state.apply_move(move[0], move[1])
-                    # print('Starting thread for move', child_state.move_history)
-                    futures.append(executor.submit(self.alphabeta, child_state, depth-1, alpha, beta, False))
-                for future in concurrent.futures.as_completed(futures):
-                    result, _ = future.result()
-                    with self.lock:
-                        value = max(value, result)
-                        if value > alpha:
-                            alpha = value
-                            best_move = futures[futures.index(future)].result()[1]
-                        if alpha >= beta:
-                            print('Pruning')
-                            break
-            return value, best_move
+            for index, move in enumerate(moves):
+                result = self.search_move(state, move, index, depth, alpha, beta, True, in_check, futile)
+                if result is None:
+                    continue
+                if result > value:
+                    value = result
+                    best_move = move
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    self.count_cutoff(index)
+                    self.orderer.add_cutoff(state, move, depth)
+                    break
         else:
             value = float('inf')
-            best_move = None
-            futures = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.threads) as executor:
-                for move in order_moves(state):
-                    child_state = state.apply_move(move[0], move[1])
-                    # print('Starting thread for move', child_state.move_history)
-                    futures.append(executor.submit(self.alphabeta, child_state, depth-1, alpha, beta, True))
-                for future in concurrent.futures.as_completed(futures):
-                    result, _ = future.result()
-                    with self.lock:
-                        value = min(value, result)
-                        if value < beta:
-                            beta = value
-                            best_move = futures[futures.index(future)].result()[1]
-                        if alpha >= beta:
-                            print('Pruning')
-                            break
-            return value, best_move
-
-    def search(self, state):
-        _, best_move = self.alphabeta(state, self.max_depth, float('-inf'), float('inf'), True)
+            for index, move in enumerate(moves):
+                result = self.search_move(state, move, index, depth, alpha, beta, False, in_check, futile)
+                if result is None:
+                    continue
+                if result < value:
+                    value = result
+                    best_move = move
+                beta = min(beta, value)
+                if alpha >= beta:
+                    self.count_cutoff(index)
+                    self.orderer.add_cutoff(state, move, depth)
+                    break
+        self.table.store(key, depth, transposition.get_bound(sign * value, low, high), sign * value, best_move)
+        return value, best_move
+
+    def search_move(self, state, move, index, depth, alpha, beta, maximizing_player, in_check, futile):
+        """Make the move at the given index of the ordered moves, search it and take it back.
+        Return its score from the point of view of the maximizing player, or None if it was pruned."""
+        quiet = not move & TACTICAL_MOVE
+        state.push(move)
+        gives_check = state.is_in_check(state.current_player)
+        if futile and quiet and not gives_check and index > 0:
+            state.pop()
+            return None
+        reduction = 0
+        if self.late_move_reductions and quiet and not in_check and not gives_check:
+            reduction = get_late_move_reduction(depth, index)
+        result, _ = self.alphabeta(state, depth - 1 - reduction, alpha, beta, not maximizing_player)
+        # A reduced move that looks better than the best move so far is searched again to the full depth
+        if reduction and (result > alpha if maximizing_player else result < beta):
+            result, _ = self.alphabeta(state, depth - 1, alpha, beta, not maximizing_player)
+        state.pop()
+        return result
+
+    def count_cutoff(self, index):
+        """Count a beta cutoff caused by the move searched at the given index"""
+        stats = self.stats.current
+        stats.beta_cutoffs += 1
+        if index == 0:
+            stats.first_move_cutoffs += 1
+
+    def quiescence(self, state, alpha, beta):
+        """Search captures and promotions until the position is quiet, then evaluate it.
+        Scores are from the point of view of the player to move."""
+        return quiescence(self, state, alpha, beta)
+
+    def search_root_moves(self, state, moves, depth, bounds):
+        """Search the given root moves to the given depth and return the score, the move and whether the score
+        is exact of each. The best score found so far is shared with the other processes through bounds."""
+        results = []
+        for move in moves:
+            with self.lock:
+                alpha = bounds.alpha
+            state.push(move)
+            value, _ = self.alphabeta(state, depth - 1, alpha, bounds.beta, False)
+            state.pop()
+            with self.lock:
+                bounds.alpha = max(bounds.alpha, value)
+            # A move that does not beat the bound it was searched with only gets an upper bound of its score
+            results.append((value, move, value > alpha))
+        return results
+
+    def search_depth(self, state, moves, depth):
+        """Search the root moves to the given depth and return the best score with its move.
+        Raises SearchAborted if a limit is reached before all root moves are searched."""
+        if self.threads > 1:
+            return self.search_depth_parallel(state, moves, depth)
+        results = self.search_root_moves(state, moves, depth, MinMaxValues())
+        best_value, best_move, _ = max(results, key=lambda result: result[0])
+        self.table.store(state.hash, depth, transposition.EXACT, best_value, best_move)
+        self.pv = [best_move]
+        state.push(best_move)
+        self.pv += self.get_pv(state, depth - 1)
+        state.pop()
+        return best_value, best_move
+
+    def search_depth_parallel(self, state, moves, depth):
+        """Search the root moves to the given depth on the process pool.
+        The first move is searched alone to get a good bound for the others, which are then searched in parallel.
+        A move only gets the bound of the moves finished before it started, and every process has a table of its own,
+        so all processes together search more nodes than one process would. To keep that small, every root move is
+        searched along its principal variation of the previous iteration first."""
+        pool = self.get_pool()
+        self.shared_alpha.value = float('-inf')
+        self.pool_nodes.value = self.nodes
+        futures = [pool.submit(_search_root_move, state, moves[0], depth, self.stop_time, self.node_limit,
+                               self.root_pvs.get(moves[0], []))]
+        try:
+            concurrent.futures.wait(futures)
+            futures[0].result()
+            futures += [pool.submit(_search_root_move, state, move, depth, self.stop_time, self.node_limit,
+                                    self.root_pvs.get(move, []))
+                        for move in moves[1:]]
+            results = []
+            for future in futures:
+                value, exact, pv, stats = future.result()
+                self.stats.current.add(stats)
+                results.append((value, exact, pv))
+        except SearchAborted:
+            # Stop the other processes and wait for them, so the next search starts with an idle pool
+            self.stop_flag.value = 1
+            concurrent.futures.wait(futures)
+            raise
+        finally:
+            # Every task gave back the nodes it claimed but did not search, so the shared count is exact
+            self.nodes = self.pool_nodes.value
+
+        # A move that started after a better one finished is searched with that move's score as the bound.
+        # It may return that score as its upper bound, so an exact score wins a tie.
+        best_value, _, self.pv = max(results, key=lambda result: (result[0], result[1]))
+        self.table.store(state.hash, depth, transposition.EXACT, best_value, self.pv[0])
+        self.root_pvs = {pv[0]: pv for _, _, pv in results}
+        return best_value, self.pv[0]
+
+    def seed_pv(self, state, pv):
+        """Store the moves of the given principal variation of the state in the table, where there is no move yet.
+        Every worker process of a parallel search has a table of its own that has not seen most of the tree
+        the other processes searched, so the principal variations of the previous iteration are passed on
+        to be searched first. They are stored with depth 0, so they only order moves and never cut off."""
+        made = 0
+        for move in pv:
+            if move not in state.generate_moves():
+                break
+            if self.table.get_move(state.hash) is None:
+                self.table.store(state.hash, 0, transposition.EXACT, 0, move)
+            state.push(move)
+            made += 1
+        for _ in range(made):
+            state.pop()
+
+    def get_pv(self, state, depth):
+        """Return the principal variation of the given length by following the best moves in the table"""
+        pv = []
+        move = self.table.get_move(state.hash)
+        while move is not None and len(pv) < depth and move in state.generate_moves():
+            pv.append(move)
+            state.push(move)
+            move = self.table.get_move(state.hash)
+        for _ in pv:
+            state.pop()
+        return pv
+
+    def stop(self):
+        """Stop the running search as soon as possible, it still returns the best move found so far.
+        Safe to call from another thread."""
+        self.stop_event.set()
+        if self.stop_flag is not None:
+            self.stop_flag.value = 1
+
+    def ponder(self, state, expected_reply):
+        """Start searching the position after the expected reply of the opponent on a background thread,
+        while the opponent thinks. The state itself is not touched, the search runs on a copy of it.
+        If the opponent plays the expected reply, the next call to search() lets the ponder search go on
+        under its limits instead of starting over, otherwise it stops pondering and finds the table warm.
+        A reply that is not a legal move is ignored."""
+        self.stop_pondering()
+        if expected_reply not in state.generate_moves():
+            return
+        ponder_state = copy.deepcopy(state)
+        ponder_state.push(expected_reply)
+        self.ponder_hash = ponder_state.hash
+        self.ponder_result = None
+        # Pondering has no limits until the opponent moves, they are set here so search() can not overwrite
+        # the limits of a ponder hit that comes before the thread starts
+        self.stop_event.clear()
+        self.set_limits(None, None)
+        self.depth_limit = self.max_depth
+        self.ponder_thread = threading.Thread(target=self.run_ponder, args=(ponder_state,), daemon=True)
+        self.ponder_thread.start()
+
+    def run_ponder(self, state):
+        self.ponder_result = self.search(state)
+
+    def finish_ponder_hit(self, depth, movetime, nodes):
+        """Let the ponder search, which searches the position the opponent just reached, go on under the limits
+        of search() and return its best move"""
+        self.depth_limit = min(self.depth_limit, depth or self.max_depth)
+        if nodes is not None:
+            self.node_limit = self.nodes + nodes
+        self.ponder_thread.join(movetime / 1000 if movetime is not None else None)
+        self.stop_pondering()
+        return self.ponder_result
+
+    def stop_pondering(self):
+        """Stop the ponder search, if any, and wait for it to finish"""
+        if self.ponder_thread is not None:
+            self.stop()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+
+    def set_limits(self, movetime, nodes):
+        """Reset the node count and set the time and node limits of a new search"""
+        self.nodes = 0
+        self.node_limit = nodes
+        self.stop_time = time.time() + movetime / 1000 if movetime is not None else None
+        self.stopped = False
+        if self.stop_flag is not None:
+            self.stop_flag.value = 0
+
+    def search(self, state, depth=None, movetime=None, nodes=None):
+        """Return the best move for the player to move, searching one ply deeper in every iteration.
+        The search stops at the given depth (max_depth by default), after movetime milliseconds,
+        after searching the given number of nodes or when stop() is called, whichever comes first.
+        The best move of the last completed iteration is returned, the statistics of every iteration
+        are kept in self.stats."""
+        pondering = threading.current_thread() is self.ponder_thread
+        if not pondering:
+            if self.ponder_thread is not None and self.ponder_hash == state.hash:
+                return self.finish_ponder_hit(depth, movetime, nodes)
+            self.stop_pondering()
+            self.stop_event.clear()
+        self.stats = SearchStats(self.stats_output)
+        self.orderer.start_search(state)
+        moves = self.orderer.order_moves(state, state.generate_moves(), self.table.get_move(state.hash))
+        if len(moves) <= 1:
+            self.pv = moves[:1]
+            return moves[0] if moves else None
+
+        if not pondering:
+            self.set_limits(movetime, nodes)
+            self.depth_limit = depth or self.max_depth
+        root_moves_made = len(state.undo_stack)
+        self.root_pvs = {}
+        best_move = moves[0]
+        iteration_depth = 0
+        # depth_limit is read in every iteration, a ponder hit can lower it while the search runs
+        while iteration_depth < self.depth_limit:
+            iteration_depth += 1
+            self.stats.start_depth(iteration_depth)
+            try:
+                best_value, best_move = self.search_depth(state, moves, iteration_depth)
+            except SearchAborted:
+                # Take back the moves of the search that was interrupted
+                while len(state.undo_stack) > root_moves_made:
+                    state.pop()
+                self.stats.finish_depth(completed=False)
+                break
+            self.stats.finish_depth()
+            # Search the best move and the rest of the principal variation first in the next iteration
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            if abs(best_value) >= MATE_SCORE:
+                break
+        self.stop_time = None
+        self.node_limit = None
         return best_move
+
+    def search_multipv(self, state, num_lines, depth=None, movetime=None, nodes=None):
+        """Return the best num_lines moves for the player to move as Lines, best first.
+        The root moves are searched in one pass per iteration, with the score of the num_lines-th best move so far
+        as alpha instead of the best one, so the scores of all lines are exact and every other move still
+        gets cut off. The search runs in this process only, the limits are the same as for search()
+        and the lines of the last completed iteration are returned, at least one even if none was completed."""
+        self.stop_pondering()
+        self.stop_event.clear()
+        self.stats = SearchStats(self.stats_output)
+        self.orderer.start_search(state)
+        moves = self.orderer.order_moves(state, state.generate_moves(), self.table.get_move(state.hash))
+        if not moves:
+            return []
+
+        self.set_limits(movetime, nodes)
+        root_moves_made = len(state.undo_stack)
+        lines = []
+        for iteration_depth in range(1, (depth or self.max_depth) + 1):
+            self.stats.start_depth(iteration_depth)
+            try:
+                results = self.search_root_lines(state, moves, iteration_depth, num_lines)
+            except SearchAborted:
+                while len(state.undo_stack) > root_moves_made:
+                    state.pop()
+                self.stats.finish_depth(completed=False)
+                break
+            self.stats.finish_depth()
+            results.sort(key=lambda result: result[0], reverse=True)
+            lines = []
+            for value, move in results[:num_lines]:
+                state.push(move)
+                lines.append(Line(move, value, iteration_depth, [move] + self.get_pv(state, iteration_depth - 1)))
+                state.pop()
+            self.table.store(state.hash, iteration_depth, transposition.EXACT, lines[0].score, lines[0].move)
+            # Search the lines in order first in the next iteration
+            moves = [move for _, move in results]
+        if not lines:
+            # Stopped before the first iteration was done, fall back to the ordered moves like search() does,
+            # scored with the evaluation of the position itself
+            value = self.engine.evaluate_for_maximizing_player(state)
+            lines = [Line(move, value, 0, [move]) for move in moves[:num_lines]]
+        self.pv = lines[0].pv
+        self.stop_time = None
+        self.node_limit = None
+        return lines
+
+    def search_root_lines(self, state, moves, depth, num_lines):
+        """Search the root moves to the given depth, keeping the scores of the best num_lines exact.
+        Return the scores with their moves."""
+        results = []
+        best_values = []  # The scores of the best num_lines moves so far, best first
+        for move in moves:
+            alpha = best_values[-1] if len(best_values) == num_lines else float('-inf')
+            state.push(move)
+            value, _ = self.alphabeta(state, depth - 1, alpha, float('inf'), False)
+            state.pop()
+            results.append((value, move))
+            if value > alpha:
+                best_values = sorted(best_values + [value], reverse=True)[:num_lines]
+        return results
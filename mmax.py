@@ -1,83 +1,193 @@
-import util
-import random
 from amsel_engine import Engine
+import transposition
+from minimax import MATE_SCORE, NULL_MOVE_REDUCTION, NULL_WINDOW, FUTILITY_MARGIN, RAZORING_MARGINS, \
+    get_late_move_reduction, quiescence
+from ordering import MoveOrderer, TACTICAL_MOVE
+from search_stats import SearchStats
+from transposition import TranspositionTable
 
-
-def order_moves(state):
-    legal_moves = state.get_valid_moves()
-    random.shuffle(legal_moves)
-    if len(legal_moves) <= 1:
-        return legal_moves
-    else:
-        ordered_moves = []
-        # First, order by captures
-        for move in legal_moves:
-            if state.is_capture(move):
-                ordered_moves.append(move)
-        # Then, order by check
-        for move in legal_moves:
-            new_state = state.apply_move(move[0], move[1])
-            if new_state.is_in_check(new_state.current_player):
-                if move not in ordered_moves:
-                    ordered_moves.append(move)
-            if new_state.is_checkmate():
-                if move not in ordered_moves:
-                    ordered_moves.append(move)
-            elif new_state.is_in_check(new_state.current_player):
-                continue
-            else:
-                piece = state.board.get_piece_by_square(move[0])
-                threatened_squares = piece.get_legal_moves(state.board)
-                for threatened_pos in threatened_squares:
-                    threatened_square = util.coordinates_to_square(threatened_pos[0], threatened_pos[1])
-                    threatened_piece = new_state.board.get_piece_by_square(threatened_square)
-                    if threatened_piece is not None and threatened_piece.color != piece.color:
-                        if move not in ordered_moves:
-                            ordered_moves.append(move)
-                            break
-        # Finally, add any remaining legal moves that haven't been added yet
-        for move in legal_moves:
-            if move not in ordered_moves:
-                ordered_moves.append(move)
-        return ordered_moves
+# Half the width of the first window searched around the score of the previous iteration, in pawns
+ASPIRATION_WINDOW = 0.5
+# A window that had to be widened to this many pawns is opened completely
+ASPIRATION_LIMIT = 8
 
 
 class Negamax:
-    def __init__(self, depth):
+    def __init__(self, depth, hash_size=16, stats_output=None,
+                 null_move=True, late_move_reductions=True, futility_pruning=True, razoring=True):
         self.engine = Engine()
         self.max_depth = depth
+        self.table = TranspositionTable(hash_size)
+        self.orderer = MoveOrderer()
+        # The selective search features, each can be turned off to measure its effect
+        self.null_move = null_move
+        self.late_move_reductions = late_move_reductions
+        self.futility_pruning = futility_pruning
+        self.razoring = razoring
+        # Statistics of the last search, written as JSON lines to stats_output if it is given
+        self.stats_output = stats_output
+        self.stats = SearchStats()
 
-    def alphabeta(self, state, depth, alpha, beta):
-        if depth == 0 or state.is_game_over():
+    def alphabeta(self, state, depth, alpha, beta, allow_null=True):
+        """Return the score of the state searched to the given depth, from the point of view of the player to move.
+        allow_null is False right after a null move, two null moves in a row would search nothing."""
+        stats = self.stats.current
+        stats.nodes += 1
+        # Never called for the root, so a repetition, the fifty move rule or bare kings are a draw here
+        if state.is_draw():
+            return 0
+        if state.is_game_over():
+            stats.eval_calls += 1
             return self.engine.evaluate_for_maximizing_player(state)
+        if depth == 0:
+            return self.quiescence(state, alpha, beta)
+
+        key = state.hash
+        entry = self.table.probe(key)
+        stats.tt_probes += 1
+        if entry is not None:
+            stats.tt_hits += 1
+        score = transposition.get_cutoff(entry, depth, alpha, beta)
+        if score is not None:
+            return score
+
+        moves = self.orderer.order_moves(state, state.generate_moves(), entry.move if entry is not None else None)
+        in_check = state.is_in_check(state.current_player)
+        if not moves:
+            # Checkmate or stalemate, prefer the quickest mate
+            if in_check:
+                return -(MATE_SCORE + depth)
+            return 0
 
-        for move in order_moves(state):
-            new_state = state.apply_move(move[0], move[1])
-            print('Evaluating line', new_state.move_history)
-            value = self.alphabeta(new_state, depth - 1, alpha, beta)
+        static_eval = None
+        if not in_check and (self.null_move or self.futility_pruning or self.razoring):
+            stats.eval_calls += 1
+            static_eval = self.engine.evaluate_for_maximizing_player(state)
+
+        # Razoring: a position far below alpha near the leaves is only checked for tactics
+        if self.razoring and static_eval is not None and depth < len(RAZORING_MARGINS) and \
+                static_eval + RAZORING_MARGINS[depth] <= alpha:
+            score = self.quiescence(state, alpha, beta)
+            if score <= alpha:
+                return score
+
+        # Null move pruning: if passing still beats beta, a real move will too, except in zugzwang,
+        # which is common enough in the endgame that a cutoff is verified there by a reduced search
+        if self.null_move and allow_null and static_eval is not None and static_eval >= beta and \
+                depth > NULL_MOVE_REDUCTION:
+            state.push_null()
+            score = -self.alphabeta(state, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW, False)
+            state.pop()
+            if score >= beta and state.board.is_endgame():
+                score = self.alphabeta(state, depth - NULL_MOVE_REDUCTION, beta - NULL_WINDOW, beta, False)
+            if score >= beta:
+                return beta
+
+        # Futility pruning: at the last ply, quiet moves can not bring a position far below alpha back up
+        futile = self.futility_pruning and static_eval is not None and depth == 1 and \
+            static_eval + FUTILITY_MARGIN <= alpha
+
+        original_alpha = alpha
+        best_move = None
+        for index, move in enumerate(moves):
+            quiet = not move & TACTICAL_MOVE
+            state.push(move)
+            gives_check = state.is_in_check(state.current_player)
+            if futile and quiet and not gives_check and index > 0:
+                state.pop()
+                continue
+            reduction = 0
+            if self.late_move_reductions and quiet and not in_check and not gives_check:
+                reduction = get_late_move_reduction(depth, index)
+            value = self.search_move(state, index, depth, alpha, beta, reduction)
+            state.pop()
+            if value > alpha or best_move is None:
+                best_move = move
             alpha = max(alpha, value)
             if alpha >= beta:
-                print('Pruning line', new_state.move_history)
-                return alpha
+                stats.beta_cutoffs += 1
+                if index == 0:
+                    stats.first_move_cutoffs += 1
+                self.orderer.add_cutoff(state, move, depth)
+                break
 
+        self.table.store(key, depth, transposition.get_bound(alpha, original_alpha, beta), alpha, best_move)
         return alpha
 
+    def search_move(self, state, index, depth, alpha, beta, reduction=0):
+        """Return the score of the move just made on the state, which was the move at the given index of its position.
+        The first move is searched with the full window. Every later move is first searched with a zero window,
+        which only tells whether it beats alpha, and searched again with the full window only if it does.
+        A late move searched with a reduced depth is searched again to the full depth if it beats alpha."""
+        if index == 0:
+            return -self.alphabeta(state, depth - 1, -beta, -alpha)
+        value = -self.alphabeta(state, depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha)
+        if reduction and value > alpha:
+            value = -self.alphabeta(state, depth - 1, -alpha - NULL_WINDOW, -alpha)
+        if alpha < value < beta:
+            value = -self.alphabeta(state, depth - 1, -beta, -alpha)
+        return value
+
+    def quiescence(self, state, alpha, beta):
+        """Search captures and promotions until the position is quiet, then evaluate it.
+        The same quiescence search as the one of Minimax."""
+        return quiescence(self, state, alpha, beta)
+
+    def check_limits(self):
+        """Called by the quiescence search at every node, a Negamax search has no limits"""
+        pass
+
     def find_best_move(self, state):
-        best_move = None
-        legal_moves = order_moves(state)
-        alpha = float('-inf')
-        beta = float('inf')
-
-        if len(legal_moves) == 1:
-            return legal_moves[0]
-
-        for move in legal_moves:
-            new_state = state.apply_move(move[0], move[1])
-            score = self.alphabeta(new_state, self.max_depth, alpha, beta)
-            if score >= 1000:
-                return move
-            if score > alpha:
-                alpha = score
-                best_move = move
+        """Return the best move for the player to move, searching one ply deeper in every iteration up to max_depth.
+        The statistics of the search are kept in self.stats."""
+        self.stats = SearchStats(self.stats_output)
+        self.orderer.start_search(state)
+        moves = self.orderer.order_moves(state, state.generate_moves(), self.table.get_move(state.hash))
+        if len(moves) <= 1:
+            return moves[0] if moves else None
 
+        best_move = moves[0]
+        score = None
+        for depth in range(1, self.max_depth + 1):
+            self.stats.start_depth(depth)
+            score, best_move = self.search_with_aspiration(state, moves, depth, score)
+            self.stats.finish_depth()
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            if abs(score) >= MATE_SCORE:
+                break
         return best_move
+
+    def search_with_aspiration(self, state, moves, depth, previous_score):
+        """Search the root moves in a narrow window around the score of the previous iteration,
+        widening the window on the side the score falls outside of until it falls inside"""
+        if previous_score is None:
+            return self.search_root(state, moves, depth, float('-inf'), float('inf'))
+        window = ASPIRATION_WINDOW
+        alpha, beta = previous_score - window, previous_score + window
+        while True:
+            score, best_move = self.search_root(state, moves, depth, alpha, beta)
+            if alpha < score < beta:
+                return score, best_move
+            # Give up on a narrow window once the score moved by more than a piece
+            window *= 4
+            if score <= alpha:
+                alpha = score - window if window < ASPIRATION_LIMIT else float('-inf')
+            else:
+                beta = score + window if window < ASPIRATION_LIMIT else float('inf')
+
+    def search_root(self, state, moves, depth, alpha, beta):
+        """Search the root moves to the given depth within the window (alpha, beta).
+        Return the best score with its move."""
+        best_move = moves[0]
+        best_score = float('-inf')
+        for index, move in enumerate(moves):
+            state.push(move)
+            score = self.search_move(state, index, depth, max(alpha, best_score), beta)
+            state.pop()
+            if score > best_score:
+                best_score, best_move = score, move
+            if best_score >= beta:
+                break
+        self.table.store(state.hash, depth, transposition.get_bound(best_score, alpha, beta), best_score, best_move)
+        return best_score, best_move
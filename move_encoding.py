@@ -0,0 +1,96 @@
+# This file contains the compact move format used by the move generator, the Game class and the searches.
+# A move is a single int holding the start and end board index, the piece a pawn promotes to and some flags:
+#   bits 0-5    start index
+#   bits 6-11   end index
+#   bits 12-14  promotion piece (0 if the move is not a promotion, see PROMOTION_TYPES)
+#   bits 15-18  flags (capture, en passant, castle, double pawn push)
+# Helpers convert moves to and from the (start, end) square tuples used by the GUI and the command line,
+# and to and from UCI strings such as 'e2e4' or 'e7e8q'.
+
+import util
+
+NULL_MOVE = 0
+
+START_MASK = 0x3f
+END_SHIFT = 6
+PROMOTION_SHIFT = 12
+PROMOTION_MASK = 0x7
+
+CAPTURE = 1 << 15
+EN_PASSANT = 1 << 16
+CASTLE = 1 << 17
+DOUBLE_PUSH = 1 << 18
+
+# Promotion pieces by their code in a move, the letters are the ones used in UCI strings
+PROMOTION_TYPES = (None, 'knight', 'bishop', 'rook', 'queen')
+PROMOTION_LETTERS = (None, 'n', 'b', 'r', 'q')
+PROMOTION_CODES = {'knight': 1, 'bishop': 2, 'rook': 3, 'queen': 4}
+
+
+def encode_move(start, end, promotion=None, flags=0):
+    """Return the move from the start to the end board index, promoting to the given piece type if any"""
+    move = start | end << END_SHIFT | flags
+    if promotion is not None:
+        move |= PROMOTION_CODES[promotion] << PROMOTION_SHIFT
+    return move
+
+
+def get_start(move):
+    """Return the board index the move starts on"""
+    return move & START_MASK
+
+
+def get_end(move):
+    """Return the board index the move ends on"""
+    return move >> END_SHIFT & START_MASK
+
+
+def get_promotion(move):
+    """Return the piece type a pawn promotes to with the move, or None if it is not a promotion"""
+    return PROMOTION_TYPES[move >> PROMOTION_SHIFT & PROMOTION_MASK]
+
+
+def is_capture(move):
+    """Return True if the move captures a piece, including en passant captures"""
+    return move & CAPTURE != 0
+
+
+def to_tuple(move):
+    """Return the move as a (start, end) tuple of squares"""
+    return util.SQUARE_NAMES[move & START_MASK], util.SQUARE_NAMES[move >> END_SHIFT & START_MASK]
+
+
+def from_tuple(board, move, promotion=None):
+    """Return the move given as a (start, end) tuple of squares on the given board.
+    A pawn reaching the last rank promotes to the given piece type, a queen if none is given."""
+    start = util.SQUARE_INDICES[move[0]]
+    end = util.SQUARE_INDICES[move[1]]
+    piece = board.squares[start]
+    flags = 0
+    if board.squares[end] is not None:
+        flags |= CAPTURE
+    if piece is not None and piece.type == 'pawn':
+        if start % 8 != end % 8 and board.squares[end] is None:
+            flags |= CAPTURE | EN_PASSANT
+        elif abs(start - end) == 16:
+            flags |= DOUBLE_PUSH
+        if end < 8 or end >= 56:
+            return encode_move(start, end, promotion or 'queen', flags)
+    elif piece is not None and piece.type == 'king' and abs(start - end) == 2:
+        flags |= CASTLE
+    return encode_move(start, end, None, flags)
+
+
+def to_uci(move):
+    """Return the move as a UCI string such as 'e2e4' or 'e7e8q'"""
+    start, end = to_tuple(move)
+    letter = PROMOTION_LETTERS[move >> PROMOTION_SHIFT & PROMOTION_MASK]
+    return start + end + letter if letter is not None else start + end
+
+
+def from_uci(board, uci):
+    """Return the move given as a UCI string on the given board"""
+    promotion = None
+    if len(uci) == 5:
+        promotion = PROMOTION_TYPES[PROMOTION_LETTERS.index(uci[4])]
+    return from_tuple(board, (uci[:2], uci[2:4]), promotion)
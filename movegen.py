@@ -0,0 +1,205 @@
+# This file contains the legal move generator used by the Game class.
+# Instead of trying every pseudo-legal move on a copy of the game and checking whether the king is left in check,
+# the pinned pieces and the pieces giving check are found once per position, and only legal moves are emitted.
+
+import move_encoding
+import util
+from board import ORTHOGONAL_SLIDERS, DIAGONAL_SLIDERS
+
+
+def get_checkers_and_pins(squares, king_index, color):
+    """Return the board indices of the enemy pieces giving check to the king of the given color,
+    the squares a non-king move has to land on to resolve a single check,
+    and a dictionary mapping every pinned piece to the squares it may still move to."""
+    enemy = util.get_opponent_color(color)
+    checkers = []
+    block_squares = set()
+    pinned = {}
+    for source in util.PAWN_ATTACK_TARGETS[color][king_index]:
+        piece = squares[source]
+        if piece is not None and piece.type == 'pawn' and piece.color == enemy:
+            checkers.append(source)
+            block_squares.add(source)
+    for source in util.KNIGHT_TARGETS[king_index]:
+        piece = squares[source]
+        if piece is not None and piece.type == 'knight' and piece.color == enemy:
+            checkers.append(source)
+            block_squares.add(source)
+    for direction, ray in enumerate(util.RAYS[king_index]):
+        sliders = ORTHOGONAL_SLIDERS if direction < 4 else DIAGONAL_SLIDERS
+        own_piece = None
+        for distance, source in enumerate(ray):
+            piece = squares[source]
+            if piece is None:
+                continue
+            if piece.color == color:
+                if own_piece is not None:
+                    break
+                own_piece = source
+                continue
+            if piece.type in sliders:
+                if own_piece is None:
+                    checkers.append(source)
+                    block_squares.update(ray[:distance + 1])
+                else:
+                    pinned[own_piece] = set(ray[:distance + 1])
+            break
+    return checkers, block_squares, pinned
+
+
+def get_piece_targets(squares, index, piece, en_passant_square):
+    """Return the board indices a non-king piece on the given index can move to, ignoring checks and pins"""
+    color = piece.color
+    targets = []
+    if piece.type == 'pawn':
+        step = -8 if color == 'white' else 8
+        start_rank = 6 if color == 'white' else 1
+        forward = index + step
+        if squares[forward] is None:
+            targets.append(forward)
+            if index // 8 == start_rank and squares[forward + step] is None:
+                targets.append(forward + step)
+        for target in util.PAWN_ATTACK_TARGETS[color][index]:
+            captured = squares[target]
+            if (captured is not None and captured.color != color) or target == en_passant_square:
+                targets.append(target)
+    elif piece.type == 'knight':
+        for target in util.KNIGHT_TARGETS[index]:
+            captured = squares[target]
+            if captured is None or captured.color != color:
+                targets.append(target)
+    else:
+        directions = range(8)
+        if piece.type == 'rook':
+            directions = range(4)
+        elif piece.type == 'bishop':
+            directions = range(4, 8)
+        rays = util.RAYS[index]
+        for direction in directions:
+            for target in rays[direction]:
+                captured = squares[target]
+                if captured is None:
+                    targets.append(target)
+                else:
+                    if captured.color != color:
+                        targets.append(target)
+                    break
+    return targets
+
+
+def is_legal_en_passant(board, start, end, king_index, color):
+    """Return True if capturing en passant from start to end does not leave the king in check.
+    Both pawns leave the same rank at once, which a pin check on single pieces can not see."""
+    captured_index = start - start % 8 + end % 8
+    pawn, captured = board.squares[start], board.squares[captured_index]
+    board.set_piece(start, None)
+    board.set_piece(captured_index, None)
+    board.set_piece(end, pawn)
+    in_check = board.is_attacked(king_index, util.get_opponent_color(color))
+    board.set_piece(end, None)
+    board.set_piece(captured_index, captured)
+    board.set_piece(start, pawn)
+    return not in_check
+
+
+def get_castling_targets(game, king_index, color):
+    """Return the board indices the king can castle to. The king may not be in check when this is called."""
+    board = game.board
+    squares = board.squares
+    enemy = util.get_opponent_color(color)
+    rights = game.castling_rights[color]
+    home = 60 if color == 'white' else 4
+    targets = []
+    if king_index != home:
+        return targets
+    rook = squares[home + 3]
+    if rights['K'] and rook is not None and rook.type == 'rook' and rook.color == color and \
+            squares[home + 1] is None and squares[home + 2] is None and \
+            not board.is_attacked(home + 1, enemy) and \
+            not board.is_attacked(home + 2, enemy):
+        targets.append(home + 2)
+    rook = squares[home - 4]
+    if rights['Q'] and rook is not None and rook.type == 'rook' and rook.color == color and \
+            squares[home - 1] is None and squares[home - 2] is None and squares[home - 3] is None and \
+            not board.is_attacked(home - 1, enemy) and \
+            not board.is_attacked(home - 2, enemy):
+        targets.append(home - 2)
+    return targets
+
+
+def add_moves(moves, squares, index, target, piece):
+    """Append the move of the piece from index to target to the list of moves, with its flags set.
+    A pawn reaching the last rank adds one move per promotion piece."""
+    move = index | target << move_encoding.END_SHIFT
+    if squares[target] is not None:
+        move |= move_encoding.CAPTURE
+    if piece.type == 'pawn':
+        if index % 8 != target % 8 and squares[target] is None:
+            move |= move_encoding.CAPTURE | move_encoding.EN_PASSANT
+        elif abs(index - target) == 16:
+            move |= move_encoding.DOUBLE_PUSH
+        if target < 8 or target >= 56:
+            for code in (4, 1, 3, 2):
+                moves.append(move | code << move_encoding.PROMOTION_SHIFT)
+            return
+    moves.append(move)
+
+
+def generate_legal_moves(game, from_index=None):
+    """Return all legal moves for the current player as moves encoded by the moves module in one pass.
+    If from_index is given, only the moves of the piece on that board index are returned."""
+    board = game.board
+    squares = board.squares
+    color = game.current_player
+    enemy = util.get_opponent_color(color)
+    king_pos = game.white_king_pos if color == 'white' else game.black_king_pos
+    king_index = util.coordinates_to_index(king_pos[0], king_pos[1])
+    checkers, block_squares, pinned = get_checkers_and_pins(squares, king_index, color)
+    # The en passant square is only usable by the side it was set for (rank 6 for white, rank 3 for black)
+    en_passant_square = game.en_passant_square
+    if en_passant_square is not None and en_passant_square // 8 != (2 if color == 'white' else 5):
+        en_passant_square = None
+    end_shift = move_encoding.END_SHIFT
+    moves = []
+
+    if from_index is None:
+        indices = board.get_indices_by_color(color)
+    else:
+        indices = [from_index]
+    for index in indices:
+        piece = squares[index]
+        if piece is None or piece.color != color:
+            continue
+
+        if piece.type == 'king':
+            # The king may not step onto an attacked square, including squares behind it on a checking ray,
+            # so the sliders are looked up as if the king had left its square
+            occupied = board.get_occupancy() & ~(1 << index)
+            for target in util.KING_TARGETS[index]:
+                captured = squares[target]
+                if captured is None:
+                    if not board.is_attacked(target, enemy, occupied):
+                        moves.append(index | target << end_shift)
+                elif captured.color != color and not board.is_attacked(target, enemy, occupied):
+                    moves.append(index | target << end_shift | move_encoding.CAPTURE)
+            if not checkers:
+                for target in get_castling_targets(game, index, color):
+                    moves.append(index | target << end_shift | move_encoding.CASTLE)
+            continue
+
+        # With two pieces giving check only the king can move
+        if len(checkers) > 1:
+            continue
+        allowed = pinned.get(index)
+        for target in get_piece_targets(squares, index, piece, en_passant_square):
+            if allowed is not None and target not in allowed:
+                continue
+            is_en_passant = piece.type == 'pawn' and target == en_passant_square
+            if checkers and target not in block_squares:
+                # An en passant capture can also remove a checking pawn
+                if not is_en_passant or index - index % 8 + target % 8 not in block_squares:
+                    continue
+            if is_en_passant and not is_legal_en_passant(board, index, target, king_index, color):
+                continue
+            add_moves(moves, squares, index, target, piece)
+    return moves
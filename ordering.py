@@ -0,0 +1,105 @@
+# This file contains the move ordering used by the searches.
+# Alpha-beta cuts off more of the tree the earlier it searches the best move, so the moves of a position
+# are put in stages that are cheap to compute and never need a move to be played:
+#   1. the best move stored in the transposition table for the position
+#   2. captures and promotions, the most valuable victim first and the least valuable attacker second
+#   3. the killer moves, quiet moves that caused a cutoff at the same ply of the search in another branch
+#   4. the remaining quiet moves, ordered by how often they caused cutoffs anywhere in the tree (history)
+
+import move_encoding
+
+# What a promotion adds to the material of the promoting side, in pawns
+PROMOTION_GAIN = 8
+# The number of killer moves kept per ply
+KILLER_SLOTS = 2
+# History scores are halved when a new search starts, so old cutoffs weigh less than new ones
+HISTORY_AGING = 2
+
+TACTICAL_MOVE = move_encoding.CAPTURE | move_encoding.PROMOTION_MASK << move_encoding.PROMOTION_SHIFT
+# The part of a move that identifies it in the history table, its start and end index
+FROM_TO_MASK = 0xfff
+
+
+def get_capture_gain(state, move):
+    """Return the most material a capture or promotion can win, in pawns"""
+    captured = state.board.squares[move_encoding.get_end(move)]
+    gain = captured.value if captured is not None else 0
+    if move & move_encoding.EN_PASSANT:
+        gain = 1
+    if move_encoding.get_promotion(move) is not None:
+        gain += PROMOTION_GAIN
+    return gain
+
+
+def order_captures(state, moves):
+    """Return the captures sorted by most valuable victim first and least valuable attacker second"""
+    squares = state.board.squares
+    return sorted(moves, reverse=True,
+                  key=lambda move: get_capture_gain(state, move) * 10 - squares[move_encoding.get_start(move)].value)
+
+
+class MoveOrderer:
+    def __init__(self):
+        self.killers = {}  # The killer moves of the running search by the ply of the search
+        self.root_ply = 0  # The number of moves played in the game at the root of the running search
+        self.history = {'white': [0] * 4096, 'black': [0] * 4096}
+
+    def order_moves(self, state, moves, hash_move=None):
+        """Return the given legal moves of the state in the order they should be searched"""
+        ordered_moves = []
+        captures = []
+        quiets = []
+        for move in moves:
+            if move == hash_move:
+                ordered_moves.append(move)
+            elif move & TACTICAL_MOVE:
+                captures.append(move)
+            else:
+                quiets.append(move)
+        ordered_moves.extend(order_captures(state, captures))
+
+        for killer in self.killers.get(len(state.move_history) - self.root_ply, ()):
+            if killer in quiets:
+                quiets.remove(killer)
+                ordered_moves.append(killer)
+
+        history = self.history[state.current_player]
+        quiets.sort(key=lambda move: history[move & FROM_TO_MASK], reverse=True)
+        ordered_moves.extend(quiets)
+        return ordered_moves
+
+    def add_cutoff(self, state, move, depth):
+        """Remember a move that caused a beta cutoff in the given state, searched to the given depth.
+        Only quiet moves are remembered, captures are ordered well without help."""
+        if move & TACTICAL_MOVE:
+            return
+        killers = self.killers.setdefault(len(state.move_history) - self.root_ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLER_SLOTS:]
+        # Deep cutoffs save more work than shallow ones
+        self.history[state.current_player][move & FROM_TO_MASK] += depth * depth
+
+    def start_search(self, state):
+        """Prepare for a new search of the given state, call this when a new search starts"""
+        self.reset_killers(state)
+        self.age()
+
+    def reset_killers(self, state):
+        """Forget the killer moves, which only fit the search they were found in, and count the plies of the
+        following search from the given state"""
+        self.killers = {}
+        self.root_ply = len(state.move_history)
+
+    def age(self):
+        """Reduce the weight of the cutoffs of earlier searches"""
+        for color_history in self.history.values():
+            for index, score in enumerate(color_history):
+                if score:
+                    color_history[index] = score // HISTORY_AGING
+
+    def clear(self):
+        """Forget all killer moves and history, for example before starting a new game"""
+        self.killers = {}
+        self.root_ply = 0
+        self.history = {'white': [0] * 4096, 'black': [0] * 4096}
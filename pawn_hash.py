@@ -0,0 +1,43 @@
+# This file contains the pawn hash table of the evaluation.
+# The pawn structure terms (chains, isolated, doubled, backward and passed pawns) only depend on where the pawns
+# stand, and most moves do not move a pawn. Their combined score for both colors is stored under the pawn hash
+# of the game and reused until the pawns change.
+# The table has a fixed number of slots, a new entry always replaces the one in its slot.
+
+# Rough memory use of one slot in bytes, the key and the score with their list slots
+ENTRY_SIZE = 100
+
+
+class PawnHashTable:
+    def __init__(self, size_mb=1):
+        self.size = max(1, size_mb * 1024 * 1024 // ENTRY_SIZE)
+        self.keys = [None] * self.size
+        self.scores = [0] * self.size
+        self.hits = 0
+        self.misses = 0
+
+    def probe(self, key):
+        """Return the pawn score stored for the given pawn hash, or None if there is none"""
+        index = key % self.size
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        """Store the pawn score of the pawn structure with the given hash"""
+        index = key % self.size
+        self.keys[index] = key
+        self.scores[index] = score
+
+    def get_hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        self.keys = [None] * self.size
+        self.scores = [0] * self.size
+        self.hits = 0
+        self.misses = 0
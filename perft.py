@@ -0,0 +1,108 @@
+from game import Game, START_FEN
+import move_encoding
+import argparse
+import multiprocessing as mp
+import sys
+import time
+# Command line tool to count the leaf nodes of the move generator's tree (perft) to a given depth.
+# It is both the speed benchmark and the correctness check of the move generator: the counts of the
+# positions in KNOWN_POSITIONS are well established, any difference means a move generation bug.
+
+# Positions with their known node counts by depth, see https://www.chessprogramming.org/Perft_Results
+KNOWN_POSITIONS = [
+    (START_FEN, [20, 400, 8902, 197281]),
+    ('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862]),
+    ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238]),
+    ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467]),
+    ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379]),
+]
+
+
+def perft(game, depth, table=None):
+    """Return the number of leaf nodes of the move tree of the given depth.
+    If a table (a dictionary) is given, subtree counts are stored in it by position hash and depth."""
+    if depth == 0:
+        return 1
+    if table is not None:
+        nodes = table.get((game.hash, depth))
+        if nodes is not None:
+            return nodes
+    moves = game.generate_moves()
+    if depth == 1:
+        # The moves are legal, so the leaves do not need to be made
+        nodes = len(moves)
+    else:
+        nodes = 0
+        for move in moves:
+            game.push(move)
+            nodes += perft(game, depth - 1, table)
+            game.pop()
+    if table is not None:
+        table[(game.hash, depth)] = nodes
+    return nodes
+
+
+def count_root_move(task):
+    """Return a root move with the node count of its subtree, run in the worker processes"""
+    fen, move, depth, use_hash = task
+    game = Game.from_fen(fen)
+    game.push(move)
+    return move, perft(game, depth - 1, {} if use_hash else None)
+
+
+def divide(fen, depth, processes=1, use_hash=False):
+    """Return a list of (move, node count) tuples, one for each root move"""
+    game = Game.from_fen(fen)
+    moves = game.generate_moves()
+    if processes > 1:
+        tasks = [(fen, move, depth, use_hash) for move in moves]
+        with mp.Pool(processes) as pool:
+            return pool.map(count_root_move, tasks)
+    table = {} if use_hash else None
+    results = []
+    for move in moves:
+        game.push(move)
+        results.append((move, perft(game, depth - 1, table)))
+        game.pop()
+    return results
+
+
+def run(fen, depth, processes=1, use_hash=False, show_divide=False):
+    """Count and print the nodes of the given position and depth, and return the node count"""
+    start_time = time.time()
+    results = divide(fen, depth, processes, use_hash)
+    elapsed = time.time() - start_time
+    nodes = sum(count for _, count in results)
+    if show_divide:
+        for move, count in sorted(results, key=lambda result: move_encoding.to_uci(result[0])):
+            print(f'{move_encoding.to_uci(move)}: {count}')
+        print()
+    nps = int(nodes / elapsed) if elapsed > 0 else 0
+    print(f'Depth {depth}: {nodes} nodes in {elapsed:.2f}s ({nps} nodes per second)')
+    return nodes
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Count the move generator\'s nodes to a given depth.')
+    parser.add_argument('--depth', type=int, default=4, help='The depth to count the nodes to.')
+    parser.add_argument('--fen', type=str, default=START_FEN, help='The position to start from.')
+    parser.add_argument('--divide', action='store_true', help='Print the node count of every root move.')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='The number of processes to split the root moves between.')
+    parser.add_argument('--hash', action='store_true', help='Memoize subtree counts by position hash.')
+    parser.add_argument('--check', action='store_true', help='Check the node counts of the known positions.')
+    args = parser.parse_args()
+
+    if args.check:
+        failed = False
+        for fen, counts in KNOWN_POSITIONS:
+            print(fen)
+            for depth, expected in enumerate(counts[:args.depth], 1):
+                nodes = run(fen, depth, args.processes, args.hash)
+                if nodes != expected:
+                    print(f'Expected {expected} nodes')
+                    failed = True
+        sys.exit(1 if failed else 0)
+
+    run(args.fen, args.depth, args.processes, args.hash, args.divide)
@@ -11,6 +11,7 @@ class Piece:
         self.color = color
         self.position = (x, y)
         self.square = util.coordinates_to_square(x, y)
+        self.index = util.coordinates_to_index(x, y)
         self.moved = False
         self.defending_pieces = []
 
@@ -22,11 +23,13 @@ class Piece:
 
     def set_position(self, position):
         self.position = position
-        self.square = util.coordinates_to_square(position[0], position[1])
+        self.index = util.coordinates_to_index(position[0], position[1])
+        self.square = util.index_to_square(self.index)
         self.moved = True
 
     def move(self, square):
-        self.position = util.square_to_coordinates(square)
+        self.index = util.square_to_index(square)
+        self.position = util.index_to_coordinates(self.index)
         self.square = square
         self.moved = True
 
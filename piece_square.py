@@ -0,0 +1,98 @@
+# This file contains the material values and piece-square tables of the evaluation.
+# Both scores only depend on which piece stands on which square, so Game keeps them as running totals:
+# whenever push() or pop() moves, captures or promotes a piece, the values of the squares it leaves and
+# enters are subtracted and added, and the evaluation reads the totals instead of scanning the board.
+# All scores are in centipawns, positive when good for white.
+
+# The value of every piece type, a pawn is worth 100
+MATERIAL_VALUES = {'pawn': 100, 'knight': 300, 'bishop': 300, 'rook': 500, 'queen': 900, 'king': 0}
+
+# Values for each piece type depending on the position on the board, from white's point of view
+# with the eighth rank in the first row
+POSITIONAL_VALUES = {
+    'pawn': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [50, 50, 50, 50, 50, 50, 50, 50],
+        [10, 10, 20, 30, 30, 20, 10, 10],
+        [5, 5, 10, 25, 25, 10, 5, 5],
+        [0, 0, 0, 20, 20, 0, 0, 0],
+        [5, -5, -10, 0, 0, -10, -5, 5],
+        [5, 10, 10, -20, -20, 10, 10, 5],
+        [0, 0, 0, 0, 0, 0, 0, 0]
+    ],
+    'knight': [
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+        [-40, -20, 0, 0, 0, 0, -20, -40],
+        [-30, 0, 10, 15, 15, 10, 0, -30],
+        [-30, 5, 15, 20, 20, 15, 5, -30],
+        [-30, 0, 15, 20, 20, 15, 0, -30],
+        [-30, 5, 10, 15, 15, 10, 5, -30],
+        [-40, -20, 0, 5, 5, 0, -20, -40],
+        [-50, -40, -30, -30, -30, -30, -40, -50]
+    ],
+    'bishop': [
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 10, 10, 5, 0, -10],
+        [-10, 5, 5, 10, 10, 5, 5, -10],
+        [-10, 0, 10, 10, 10, 10, 0, -10],
+        [-10, 10, 10, 10, 10, 10, 10, -10],
+        [-10, 5, 0, 0, 0, 0, 5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20]
+    ],
+    'rook': [
+        [0, 0, 0, 0, 0, 0, 0, 0],
+        [5, 10, 10, 10, 10, 10, 10, 5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [-5, 0, 0, 0, 0, 0, 0, -5],
+        [0, 0, 0, 5, 5, 0, 0, 0]
+    ],
+    'queen': [
+        [-20, -10, -10, -5, -5, -10, -10, -20],
+        [-10, 0, 0, 0, 0, 0, 0, -10],
+        [-10, 0, 5, 5, 5, 5, 0, -10],
+        [-5, 0, 5, 5, 5, 5, 0, -5],
+        [0, 0, 5, 5, 5, 5, 0, -5],
+        [-10, 5, 5, 5, 5, 5, 0, -10],
+        [-10, 0, 5, 0, 0, 0, 0, -10],
+        [-20, -10, -10, -5, -5, -10, -10, -20]
+    ],
+    'king': [
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-20, -30, -30, -40, -40, -30, -30, -20],
+        [-10, -20, -20, -20, -20, -20, -20, -10],
+        [20, 20, 0, 0, 0, 0, 20, 20],
+        [20, 30, 10, 0, 0, 10, 30, 20]
+    ]
+}
+
+# The piece-square value of every piece type and color on every board index, negative for black
+PIECE_SQUARE_SCORES = {
+    'white': {piece_type: [table[index // 8][index % 8] for index in range(64)]
+              for piece_type, table in POSITIONAL_VALUES.items()},
+    'black': {piece_type: [-table[7 - index // 8][index % 8] for index in range(64)]
+              for piece_type, table in POSITIONAL_VALUES.items()}
+}
+
+
+def get_material_value(piece):
+    """Return the material value of the piece, negative for black"""
+    value = MATERIAL_VALUES[piece.type]
+    return value if piece.color == 'white' else -value
+
+
+def compute_scores(board):
+    """Compute the material and piece-square score of the board from scratch"""
+    material_score = 0
+    positional_score = 0
+    for index, piece in enumerate(board.squares):
+        if piece is not None:
+            material_score += get_material_value(piece)
+            positional_score += PIECE_SQUARE_SCORES[piece.color][piece.type][index]
+    return material_score, positional_score
@@ -0,0 +1,95 @@
+# This file contains the statistics the searches collect while they run.
+# Every iteration of a search gets its own DepthStats, holding how many nodes it searched, how well its moves
+# were ordered (how often the first move caused the cutoff), how useful the transposition table was and how
+# often the evaluation function was called. SearchStats collects them for a whole search and can write them
+# as JSON lines, one line per depth.
+
+import json
+import time
+
+
+class DepthStats:
+    def __init__(self, depth):
+        self.depth = depth
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.beta_cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.eval_calls = 0
+        self.time = 0.0
+        self.completed = False
+
+    def add(self, other):
+        """Add the counters of other, the statistics of another process searching the same depth"""
+        self.nodes += other.nodes
+        self.quiescence_nodes += other.quiescence_nodes
+        self.beta_cutoffs += other.beta_cutoffs
+        self.first_move_cutoffs += other.first_move_cutoffs
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+        self.eval_calls += other.eval_calls
+
+    def get_total_nodes(self):
+        return self.nodes + self.quiescence_nodes
+
+    def get_nodes_per_second(self):
+        return self.get_total_nodes() / self.time if self.time > 0 else 0.0
+
+    def get_first_move_cutoff_rate(self):
+        """Return the fraction of beta cutoffs caused by the first move searched, a measure of move ordering"""
+        return self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+
+    def get_tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def to_dict(self):
+        return {
+            'depth': self.depth,
+            'completed': self.completed,
+            'nodes': self.nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'beta_cutoffs': self.beta_cutoffs,
+            'first_move_cutoff_rate': round(self.get_first_move_cutoff_rate(), 4),
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_hit_rate': round(self.get_tt_hit_rate(), 4),
+            'eval_calls': self.eval_calls,
+            'time': round(self.time, 4),
+            'nps': int(self.get_nodes_per_second())
+        }
+
+
+class SearchStats:
+    def __init__(self, output=None):
+        self.depths = []
+        self.current = DepthStats(0)
+        self.start_time = None
+        self.output = output  # A file to write every finished depth to as a JSON line, if any
+
+    def start_depth(self, depth):
+        """Start collecting the statistics of the iteration searching to the given depth"""
+        self.current = DepthStats(depth)
+        self.depths.append(self.current)
+        self.start_time = time.time()
+
+    def finish_depth(self, completed=True):
+        """Stop the clock of the current iteration and write its statistics if there is an output"""
+        self.current.time = time.time() - self.start_time
+        self.current.completed = completed
+        if self.output is not None:
+            self.output.write(json.dumps(self.current.to_dict()) + '\n')
+            self.output.flush()
+
+    def get_total(self):
+        """Return the statistics of all iterations added up"""
+        total = DepthStats(self.depths[-1].depth if self.depths else 0)
+        for depth_stats in self.depths:
+            total.add(depth_stats)
+            total.time += depth_stats.time
+        total.completed = all(depth_stats.completed for depth_stats in self.depths)
+        return total
+
+    def to_json_lines(self):
+        return ''.join(json.dumps(depth_stats.to_dict()) + '\n' for depth_stats in self.depths)
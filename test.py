@@ -2,11 +2,29 @@
 # Creates a board and a game and tests the get_legal_moves method for each piece.
 # Upon running this file, the test results will be printed to the console.
 
+import io
+import json
+import threading
+import time
 import unittest
+from unittest import mock
 from game import Game
 from gui import PygameGUI
 from amsel_engine import Engine
+from bitboard import iterate_bits
+from transposition import TranspositionTable
+import transposition
 import util
+import zobrist
+import piece_square
+import move_encoding
+import perft
+import minimax
+from minimax import MATE_SCORE, Minimax
+from mmax import Negamax
+from ordering import MoveOrderer
+
+SCHOLARS_MATE_FEN = 'r1bqkbnr/pppp1ppp/2n5/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 2 3'
 
 
 class TestChessEngine(unittest.TestCase):
@@ -16,6 +34,8 @@ class TestChessEngine(unittest.TestCase):
     def test_util_translations(self):
         # Test the translations in util.py
         self.assertEqual(util.square_to_coordinates("e2"), (4, 6))
+        self.assertEqual(util.square_to_index("e2"), 52)
+        self.assertEqual(util.index_to_square(0), "a8")
 
     def test_get_legal_moves_for_white_pawn(self):
         # Test white pawn
@@ -53,6 +73,275 @@ class TestChessEngine(unittest.TestCase):
         # assert that the white bishop on c1 has no legal moves
         self.assertCountEqual(white_bishop.get_legal_moves(self.game.board), [])
 
+    def test_get_valid_moves(self):
+        # Tests the legal move generator on the initial board state (20 moves) and after 1. e4 e5 2. Qh5
+        self.assertEqual(len(self.game.get_valid_moves()), 20)
+        for move in [('e2', 'e4'), ('e7', 'e5'), ('d1', 'h5')]:
+            self.game.make_move(move[0], move[1])
+        # the pawn on f7 is attacked and pinned against the king by the queen on h5
+        self.assertTrue(self.game.is_attacked('f7', 'white'))
+        self.assertFalse(self.game.is_in_check('black'))
+        self.assertEqual(self.game.get_valid_moves_for_piece('f7'), [])
+
+    def test_perft(self):
+        # Tests the move generator against the known node counts, also with memoized subtree counts
+        for fen, counts in perft.KNOWN_POSITIONS:
+            self.assertEqual(sum(count for _, count in perft.divide(fen, 2)), counts[1])
+        self.assertEqual(sum(count for _, count in perft.divide(perft.START_FEN, 3, use_hash=True)), 8902)
+
+    def test_move_encoding(self):
+        # Tests converting moves between the encoded form, (start, end) tuples and UCI strings
+        move = move_encoding.from_tuple(self.game.board, ('e2', 'e4'))
+        self.assertEqual(move_encoding.to_tuple(move), ('e2', 'e4'))
+        self.assertEqual(move_encoding.to_uci(move), 'e2e4')
+        self.assertTrue(move & move_encoding.DOUBLE_PUSH)
+        self.assertFalse(move_encoding.is_capture(move))
+        self.assertIn(move, self.game.generate_moves())
+        promotion = move_encoding.encode_move(util.square_to_index('e7'), util.square_to_index('e8'), 'knight')
+        self.assertEqual(move_encoding.to_uci(promotion), 'e7e8n')
+        self.assertEqual(move_encoding.get_promotion(promotion), 'knight')
+
+    def test_fen(self):
+        # Tests exporting the FEN of a game and setting up a game from it
+        self.assertEqual(self.game.to_fen(), 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
+        for move in [('e2', 'e4'), ('d7', 'd5'), ('e4', 'e5'), ('f7', 'f5')]:
+            self.game.make_move(move[0], move[1])
+        fen = 'rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3'
+        self.assertEqual(self.game.to_fen(), fen)
+        game = Game.from_fen(fen)
+        self.assertEqual(game.to_fen(), fen)
+        self.assertEqual(game.hash, self.game.hash)
+        self.assertIn('f6', game.get_valid_moves_for_piece('e5'))
+
+    def test_zobrist_hash(self):
+        # Tests that the hash is updated incrementally and that repeating moves leads to threefold repetition
+        initial_hash = self.game.hash
+        self.game.push(move_encoding.from_tuple(self.game.board, ('e2', 'e4')))
+        self.assertEqual(self.game.hash, zobrist.compute_hash(self.game))
+        self.assertEqual(self.game.pawn_hash, zobrist.compute_pawn_hash(self.game.board))
+        self.game.pop()
+        self.assertEqual(self.game.hash, initial_hash)
+        for move in [('g1', 'f3'), ('g8', 'f6'), ('f3', 'g1'), ('f6', 'g8')] * 2:
+            self.game.make_move(move[0], move[1])
+        self.assertEqual(self.game.hash, initial_hash)
+        self.assertTrue(self.game.is_threefold_repetition())
+
+    def test_evaluation_totals(self):
+        # Tests that the material and piece-square totals follow captures, promotions and castling
+        game = Game.from_fen('r3k2r/1P6/8/8/8/8/8/R3K2R w KQkq - 0 1')
+        initial_scores = (game.material_score, game.positional_score)
+        for move in [('b7', 'a8'), ('e8', 'g8'), ('e1', 'c1')]:
+            game.push(move_encoding.from_tuple(game.board, move, 'knight'))
+            self.assertEqual((game.material_score, game.positional_score), piece_square.compute_scores(game.board))
+        for _ in range(3):
+            game.pop()
+        self.assertEqual((game.material_score, game.positional_score), initial_scores)
+
+    def test_eval_cache(self):
+        # Tests that a cached evaluation equals the uncached one, also for a position reached with more pieces moved
+        engine = Engine()
+        uncached_engine = Engine(eval_cache_size=0)
+        moves = ['f2f4', 'g8h6', 'a2a3', 'h8g8', 'g1h3']
+        for line in [moves, moves + ['b8c6', 'h3g5', 'c6b8', 'g5h3']]:
+            game = Game()
+            for move in line:
+                game.push(move_encoding.from_uci(game.board, move))
+            self.assertEqual(engine.evaluate_position(game), uncached_engine.evaluate_position(game))
+            self.assertEqual(engine.evaluate_position(game), uncached_engine.evaluate_position(game))
+
+    def test_pawn_hash(self):
+        # Tests the pawn structure score, cached by the pawn hash until a pawn moves
+        game = Game.from_fen('4k3/p7/8/2P5/2P5/8/P7/4K3 w - - 0 1')
+        engine = Engine()
+        # White has doubled pawns on the c-file, only the one on c5 is passed, and black's pawn on a7 is blocked
+        self.assertEqual(engine.get_pawn_structure_score(game), 20)
+        self.assertEqual((engine.pawn_table.hits, engine.pawn_table.misses), (0, 1))
+        game.push(move_encoding.from_uci(game.board, 'e1d2'))
+        self.assertEqual(engine.get_pawn_structure_score(game), 20)
+        self.assertEqual((engine.pawn_table.hits, engine.pawn_table.misses), (1, 1))
+        game.push(move_encoding.from_uci(game.board, 'a7a6'))
+        engine.get_pawn_structure_score(game)
+        self.assertEqual(engine.pawn_table.misses, 2)
+
+    def test_mobility(self):
+        # Tests that mobility counts the pseudo-legal moves of a color, here the same as its legal moves,
+        # without changing the game
+        game = Game.from_fen('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1')
+        fen = game.to_fen()
+        engine = Engine()
+        self.assertAlmostEqual(engine.get_mobility_score_for_color(game, 'white'), 30 * engine.MOBILITY_WEIGHT)
+        self.assertAlmostEqual(engine.get_mobility_score_for_color(game, 'black'), 20 * engine.MOBILITY_WEIGHT)
+        self.assertEqual(game.to_fen(), fen)
+
+    def test_transposition_table(self):
+        # Tests that deeper entries are kept and shallower ones go to the always-replace slot
+        table = TranspositionTable(1)
+        key = self.game.hash
+        table.store(key, 3, transposition.EXACT, 1.5, 7)
+        other_key = key + table.size
+        table.store(other_key, 1, transposition.LOWER_BOUND, 2.0, 9)
+        self.assertEqual(table.probe(key).score, 1.5)
+        self.assertEqual(table.get_move(other_key), 9)
+        self.assertEqual(transposition.get_cutoff(table.probe(key), 2, 0, 1), 1.5)
+        self.assertIsNone(transposition.get_cutoff(table.probe(other_key), 1, 0, 3))
+
+    def test_bitboard(self):
+        # Tests the bitboards of the board and the attack queries in the initial board state
+        board = self.game.board
+        self.assertEqual(list(iterate_bits(board.get_occupancy('black'))), list(range(16)))
+        self.assertEqual(list(iterate_bits(board.get_piece_mask('pawn', 'white'))), list(range(48, 56)))
+        # the white knight on b1 attacks a3, c3 and d2
+        knight_attacks = [util.index_to_square(index) for index in iterate_bits(board.get_attacks(57))]
+        self.assertCountEqual(knight_attacks, ['a3', 'c3', 'd2'])
+        # the rook on a1 is blocked by the pawn on a2 and the knight on b1
+        rook_squares = [util.index_to_square(index) for index in iterate_bits(board.get_attacks(56))]
+        self.assertCountEqual(rook_squares, ['a2', 'b1'])
+        self.assertTrue(board.is_attacked('f3', 'white'))
+        self.assertFalse(board.is_attacked('e4', 'white'))
+        self.assertCountEqual(board.get_attackers('f3', 'white'), [util.square_to_index('e2'),
+                                                                  util.square_to_index('g2'),
+                                                                  util.square_to_index('g1')])
+        # the masks follow the pieces when a move is made and taken back
+        self.game.push(move_encoding.from_tuple(board, ('e2', 'e4')))
+        self.assertTrue(board.occupancy['white'] >> util.square_to_index('e4') & 1)
+        self.assertFalse(board.occupancy['white'] >> util.square_to_index('e2') & 1)
+        self.game.pop()
+        self.assertEqual(list(iterate_bits(board.occupancy['white'])), list(range(48, 64)))
+
+    def test_search_finds_mate(self):
+        # Tests that both searches find the mate in one Qxf7#
+        minimax = Minimax(2, 1)
+        self.assertEqual(move_encoding.to_uci(minimax.search(Game.from_fen(SCHOLARS_MATE_FEN))), 'h5f7')
+        negamax = Negamax(2)
+        self.assertEqual(move_encoding.to_uci(negamax.find_best_move(Game.from_fen(SCHOLARS_MATE_FEN))), 'h5f7')
+
+    def test_search_limits(self):
+        # Tests that the iterative deepening search stops at its depth, node and time limits,
+        # returning a legal move and leaving the game as it was
+        minimax = Minimax(20, 1)
+        fen = self.game.to_fen()
+        move = minimax.search(self.game, depth=2)
+        self.assertEqual([depth_stats.depth for depth_stats in minimax.stats.depths], [1, 2])
+        self.assertIn(move, self.game.generate_moves())
+        move = minimax.search(self.game, nodes=500)
+        self.assertLessEqual(minimax.nodes, 500)
+        self.assertIn(move, self.game.generate_moves())
+        self.assertEqual(self.game.to_fen(), fen)
+        start_time = time.time()
+        move = minimax.search(self.game, movetime=200)
+        self.assertLess(time.time() - start_time, 2)
+        self.assertIn(move, self.game.generate_moves())
+        self.assertEqual(self.game.to_fen(), fen)
+        start_time = time.time()
+        threading.Timer(0.2, minimax.stop).start()
+        move = minimax.search(self.game)
+        self.assertLess(time.time() - start_time, 2)
+        self.assertIn(move, self.game.generate_moves())
+        self.assertEqual(self.game.to_fen(), fen)
+        # The node limit of a parallel search holds for all processes together
+        minimax = Minimax(20, 2)
+        move = minimax.search(self.game, nodes=2000)
+        minimax.close()
+        self.assertLessEqual(minimax.nodes, 2000)
+        self.assertIn(move, self.game.generate_moves())
+        self.assertEqual(self.game.to_fen(), fen)
+
+    def test_selective_search(self):
+        # Tests that null move pruning, late move reductions, futility pruning and razoring
+        # do not lose a mate in two that the full width search finds
+        for fen in ['k7/8/8/8/8/8/8/1RR3K1 w - - 0 1', 'k7/8/2K5/8/8/8/8/1R6 w - - 0 1']:
+            for selective in (True, False):
+                game = Game.from_fen(fen)
+                minimax = Minimax(4, 1, 16, None, *[selective] * 4)
+                minimax.search(game)
+                self.assertEqual(minimax.table.probe(game.hash).score, MATE_SCORE)
+                negamax = Negamax(4, 16, None, *[selective] * 4)
+                negamax.find_best_move(game)
+                self.assertEqual(negamax.table.probe(game.hash).score, MATE_SCORE)
+
+    def test_search_stats(self):
+        # Tests that every iteration of a search writes its statistics as a JSON line
+        output = io.StringIO()
+        minimax = Minimax(2, 1, stats_output=output)
+        minimax.search(self.game)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([line['depth'] for line in lines], [1, 2])
+        for line in lines:
+            self.assertTrue(line['completed'])
+            self.assertGreater(line['nodes'], 0)
+            self.assertGreater(line['eval_calls'], 0)
+            self.assertLessEqual(line['tt_hits'], line['tt_probes'])
+            self.assertTrue(0 <= line['first_move_cutoff_rate'] <= 1)
+            self.assertIn('nps', line)
+        total = minimax.stats.get_total()
+        self.assertEqual(total.nodes, sum(line['nodes'] for line in lines))
+        self.assertEqual(minimax.stats.to_json_lines(), output.getvalue())
+
+    def test_parallel_search(self):
+        # Tests that searching the root moves on a process pool finds the same move and score as one process
+        # and leaves the game as it was
+        for fen in ['4k3/8/8/3q4/8/8/8/3QK3 w - - 0 1', SCHOLARS_MATE_FEN]:
+            results = []
+            for threads in (1, 2):
+                game = Game.from_fen(fen)
+                minimax = Minimax(3, threads)
+                move = minimax.search(game)
+                minimax.close()
+                self.assertEqual(game.to_fen(), fen)
+                results.append((move, minimax.table.probe(game.hash).score))
+            self.assertEqual(results[0], results[1])
+
+    def test_search_multipv(self):
+        # Tests that a multi-PV search returns distinct legal moves, best first,
+        # and still returns lines when it is stopped before the first iteration is done
+        game = Game.from_fen(SCHOLARS_MATE_FEN)
+        lines = Minimax(2, 1).search_multipv(game, 3)
+        moves = [line.move for line in lines]
+        self.assertEqual(len(set(moves)), 3)
+        self.assertTrue(all(move in game.generate_moves() for move in moves))
+        self.assertEqual([line.score for line in lines], sorted((line.score for line in lines), reverse=True))
+        self.assertEqual(move_encoding.to_uci(moves[0]), 'h5f7')
+        lines = Minimax(4, 1).search_multipv(self.game, 3, nodes=10)
+        self.assertTrue(lines)
+        self.assertTrue(all(line.move in self.game.generate_moves() for line in lines))
+        self.assertEqual(self.game.to_fen(), Game().to_fen())
+
+    def test_move_ordering(self):
+        # Tests that the hash move is searched first and captures before quiet moves,
+        # and that killer moves are kept by the ply of the search and forgotten when a new search starts
+        game = Game.from_fen(SCHOLARS_MATE_FEN)
+        moves = game.generate_moves()
+        hash_move = move_encoding.from_uci(game.board, 'g1f3')
+        orderer = MoveOrderer()
+        ordered_moves = orderer.order_moves(game, moves, hash_move)
+        self.assertCountEqual(ordered_moves, moves)
+        self.assertEqual(ordered_moves[0], hash_move)
+        is_capture = [move_encoding.is_capture(move) for move in ordered_moves[1:]]
+        self.assertEqual(is_capture, sorted(is_capture, reverse=True))
+        orderer.start_search(self.game)
+        for move in ['e2e4', 'e7e5']:
+            self.game.push(move_encoding.from_uci(self.game.board, move))
+        killer = move_encoding.from_uci(self.game.board, 'b1c3')
+        orderer.add_cutoff(self.game, killer, 1)
+        self.assertEqual(orderer.killers, {2: [killer]})
+        self.assertEqual(orderer.order_moves(self.game, self.game.generate_moves())[0], killer)
+        orderer.start_search(game)
+        self.assertEqual(orderer.killers, {})
+
+    def test_quiescence(self):
+        # Tests that the quiescence search wins a hanging queen, gives the same score in both searches
+        # and that delta pruning does not change the score of quiet or simple tactical positions
+        for fen in ['4k3/8/8/3q4/8/8/8/3QK3 w - - 0 1',
+                    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1']:
+            game = Game.from_fen(fen)
+            score = Minimax(1, 1).quiescence(game, float('-inf'), float('inf'))
+            self.assertEqual(Negamax(1).quiescence(game, float('-inf'), float('inf')), score)
+            with mock.patch.object(minimax, 'DELTA_MARGIN', float('inf')):
+                self.assertEqual(Minimax(1, 1).quiescence(game, float('-inf'), float('inf')), score)
+            self.assertEqual(game.to_fen(), fen)
+        game = Game.from_fen('4k3/8/8/3q4/8/8/8/3QK3 w - - 0 1')
+        self.assertGreater(Minimax(1, 1).quiescence(game, float('-inf'), float('inf')), 8)
+
     def test_engine(self):
         # Tests the engine
         engine = Engine()
@@ -0,0 +1,83 @@
+# This file contains the transposition table shared by the searches.
+# Positions reached through different move orders have the same Zobrist hash, so the result of searching
+# a position once can be reused: as a score cutoff if it was searched deep enough, and otherwise to try
+# the best move found before first.
+# The table has a fixed number of buckets derived from its memory size. Every bucket holds two entries:
+# one that is only replaced by a search of at least the same depth, and one that is always replaced.
+
+from collections import namedtuple
+
+# The kind of score stored in an entry: the exact score, or a bound from a search that failed high or low
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+Entry = namedtuple('Entry', ['key', 'depth', 'bound', 'score', 'move'])
+
+# Rough memory use of one entry in bytes, the tuple with its int and float fields and the list slot
+ENTRY_SIZE = 200
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_SIZE))
+        self.depth_preferred = [None] * self.size
+        self.always_replace = [None] * self.size
+
+    def probe(self, key):
+        """Return the entry stored for the given position hash, or None if there is none"""
+        index = key % self.size
+        entry = self.depth_preferred[index]
+        if entry is not None and entry.key == key:
+            return entry
+        entry = self.always_replace[index]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        """Store the result of searching the position with the given hash to the given depth"""
+        index = key % self.size
+        entry = Entry(key, depth, bound, score, move)
+        existing = self.depth_preferred[index]
+        if existing is None or existing.key == key or depth >= existing.depth:
+            self.depth_preferred[index] = entry
+        else:
+            self.always_replace[index] = entry
+
+    def get_move(self, key):
+        """Return the best move stored for the position with the given hash, or None"""
+        entry = self.probe(key)
+        return entry.move if entry is not None else None
+
+    def clear(self):
+        """Remove all entries, for example before starting a new game"""
+        self.depth_preferred = [None] * self.size
+        self.always_replace = [None] * self.size
+
+    def get_usage(self):
+        """Return the fraction of the depth-preferred slots in use"""
+        return sum(entry is not None for entry in self.depth_preferred) / self.size
+
+
+def get_cutoff(entry, depth, alpha, beta):
+    """Return the score of the entry if it settles a search of its position to the given depth
+    within the window (alpha, beta), otherwise None"""
+    if entry is None or entry.depth < depth:
+        return None
+    if entry.bound == EXACT:
+        return entry.score
+    if entry.bound == LOWER_BOUND and entry.score >= beta:
+        return entry.score
+    if entry.bound == UPPER_BOUND and entry.score <= alpha:
+        return entry.score
+    return None
+
+
+def get_bound(score, alpha, beta):
+    """Return the bound type of a score returned by a search with the window (alpha, beta)"""
+    if score <= alpha:
+        return UPPER_BOUND
+    if score >= beta:
+        return LOWER_BOUND
+    return EXACT
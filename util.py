@@ -1,5 +1,53 @@
 # Contains some utility functions for the project
 
+# Algebraic names of the 64 squares in board index order.
+# Index 0 is a8, index 7 is h8, index 56 is a1 and index 63 is h1, so that index = y * 8 + x.
+SQUARE_NAMES = [f"{chr(ord('a') + index % 8)}{8 - index // 8}" for index in range(64)]
+SQUARE_INDICES = {square: index for index, square in enumerate(SQUARE_NAMES)}
+
+# Coordinate offsets for knight and king moves and for the eight sliding directions.
+# The first four ray directions are orthogonal (rook-like), the last four are diagonal (bishop-like).
+KNIGHT_OFFSETS = [(1, -2), (-1, -2), (1, 2), (-1, 2), (2, -1), (2, 1), (-2, -1), (-2, 1)]
+KING_OFFSETS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+RAY_DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1), (1, 1)]
+
+
+def _build_targets(offsets):
+    """Precompute the board indices reachable from every square with a single step of the given offsets"""
+    targets = []
+    for index in range(64):
+        x, y = index % 8, index // 8
+        targets.append([(y + dy) * 8 + x + dx for dx, dy in offsets if 0 <= x + dx < 8 and 0 <= y + dy < 8])
+    return targets
+
+
+def _build_rays():
+    """Precompute, for every square and direction, the board indices along the ray up to the board edge"""
+    rays = []
+    for index in range(64):
+        x, y = index % 8, index // 8
+        square_rays = []
+        for dx, dy in RAY_DIRECTIONS:
+            ray = []
+            rx, ry = x + dx, y + dy
+            while 0 <= rx < 8 and 0 <= ry < 8:
+                ray.append(ry * 8 + rx)
+                rx, ry = rx + dx, ry + dy
+            square_rays.append(ray)
+        rays.append(square_rays)
+    return rays
+
+
+KNIGHT_TARGETS = _build_targets(KNIGHT_OFFSETS)
+KING_TARGETS = _build_targets(KING_OFFSETS)
+# Squares attacked by a pawn of the given color standing on each square (white pawns move up the board)
+PAWN_ATTACK_TARGETS = {
+    'white': _build_targets([(-1, -1), (1, -1)]),
+    'black': _build_targets([(-1, 1), (1, 1)])
+}
+RAYS = _build_rays()
+
+
 def square_to_coordinates(square):
     """Convert a square on the chessboard to coordinates.
     a1 is (0, 7), h1 is (7, 7), a8 is (0, 0) and h8 is (7, 0)"""
@@ -17,6 +65,28 @@ def coordinates_to_square(x, y):
     return square
 
 
+def square_to_index(square):
+    """Convert a square on the chessboard to its board index.
+    a8 is 0, h8 is 7, a1 is 56 and h1 is 63"""
+    return SQUARE_INDICES[square]
+
+
+def index_to_square(index):
+    """Convert a board index to a square on the chessboard.
+    a8 is 0, h8 is 7, a1 is 56 and h1 is 63"""
+    return SQUARE_NAMES[index]
+
+
+def coordinates_to_index(x, y):
+    """Convert coordinates to a board index"""
+    return y * 8 + x
+
+
+def index_to_coordinates(index):
+    """Convert a board index to coordinates"""
+    return index % 8, index // 8
+
+
 def get_opponent_color(color):
     """Return the opponent's color"""
     if color == 'white':
@@ -0,0 +1,53 @@
+# This file contains the Zobrist keys used to hash chess positions.
+# A position's hash is the XOR of one random 64-bit key per piece on its square, one key if black is to move,
+# one key per castling right still available and one key for the file of the en passant square.
+# Game keeps the hash of its position up to date incrementally whenever a move is made or taken back.
+# It also keeps a pawn hash, made of the piece keys of the pawns only, which identifies the pawn structure.
+
+import random
+
+# A fixed seed keeps hashes identical between runs and between processes
+_random = random.Random(0x616d73656c)
+
+PIECE_KEYS = {color: {piece_type: [_random.getrandbits(64) for _ in range(64)]
+                      for piece_type in ('pawn', 'knight', 'bishop', 'rook', 'queen', 'king')}
+              for color in ('white', 'black')}
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+CASTLING_KEYS = {color: {side: _random.getrandbits(64) for side in ('K', 'Q')} for color in ('white', 'black')}
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+# Not part of the position hash: the evaluation cache adds it for positions Board.is_middle_game() counts
+# as middle game, which depends on which minor pieces have moved
+MIDDLE_GAME_KEY = _random.getrandbits(64)
+
+
+def get_castling_hash(castling_rights):
+    """Return the combined key of all available castling rights"""
+    key = 0
+    for color, sides in castling_rights.items():
+        for side, available in sides.items():
+            if available:
+                key ^= CASTLING_KEYS[color][side]
+    return key
+
+
+def compute_hash(game):
+    """Compute the hash of the game's position from scratch"""
+    key = 0
+    for index, piece in enumerate(game.board.squares):
+        if piece is not None:
+            key ^= PIECE_KEYS[piece.color][piece.type][index]
+    if game.current_player == 'black':
+        key ^= BLACK_TO_MOVE_KEY
+    key ^= get_castling_hash(game.castling_rights)
+    if game.en_passant_square is not None:
+        key ^= EN_PASSANT_KEYS[game.en_passant_square % 8]
+    return key
+
+
+def compute_pawn_hash(board):
+    """Compute the hash of the pawns on the board from scratch"""
+    key = 0
+    for color in ('white', 'black'):
+        for index in board.piece_squares[color]['pawn']:
+            key ^= PIECE_KEYS[color]['pawn'][index]
+    return key